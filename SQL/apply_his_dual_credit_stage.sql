@@ -0,0 +1,11 @@
+update his
+set 
+    SDE = stage.SDE,
+    ST = stage.ST,
+    CH = coalesce(stage.CH, his.CH)
+from {stage} as stage
+where
+    his.del = 0
+    and his.PID = stage.PID
+    and his.CN = stage.CN
+    and his.SQ = stage.SQ;
\ No newline at end of file
@@ -0,0 +1,9 @@
+select
+    cn as CN,
+    tm as TM,
+    dc as DC,
+    cr as CR,
+    cl as CL
+from crs
+where del = 0
+and cn in :cn_list
\ No newline at end of file
@@ -0,0 +1,5 @@
+select
+    cn as CN,
+    cl as CL
+from crs
+where cn in :cn_list
\ No newline at end of file
@@ -0,0 +1,8 @@
+{create_table} {stage} (
+    PID int not null,
+    CN varchar(10) not null,
+    SQ int not null,
+    SDE int not null,
+    ST int not null,
+    CH float null
+);
\ No newline at end of file
@@ -0,0 +1 @@
+drop table {stage};
\ No newline at end of file
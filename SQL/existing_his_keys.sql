@@ -0,0 +1,8 @@
+select
+    pid as PID,
+    cn as CN,
+    yr as YR,
+    sde as SDE
+from his
+where del = 0
+and pid in :pid_list
\ No newline at end of file
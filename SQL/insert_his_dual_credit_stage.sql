@@ -0,0 +1,2 @@
+insert into {stage} (PID, CN, SQ, SDE, ST, CH)
+values (:pid, :cn, :sq, :sde, :st, :credit_hours);
\ No newline at end of file
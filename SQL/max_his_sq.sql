@@ -0,0 +1,6 @@
+select
+    pid as PID,
+    max(sq) as SQ
+from his
+where pid in :pid_list
+group by pid
\ No newline at end of file
@@ -0,0 +1,211 @@
+import random
+import re
+import time
+from decouple import config
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from logs import get_logger
+from metrics import record_batch
+
+HIS_WRITE_ADAPTIVE = config('HIS_WRITE_ADAPTIVE', default=True, cast=bool)
+HIS_WRITE_TARGET_SECONDS = config('HIS_WRITE_TARGET_SECONDS', default=2.0, cast=float)
+HIS_WRITE_MAX_BATCH_SIZE = config('HIS_WRITE_MAX_BATCH_SIZE', default=5000, cast=int)
+HIS_WRITE_RETRIES = config('HIS_WRITE_RETRIES', default=3, cast=int)
+HIS_WRITE_BACKOFF_SECONDS = config('HIS_WRITE_BACKOFF_SECONDS', default=0.5, cast=float)
+TRANSIENT_ERROR_PATTERN = re.compile(
+    r"\b(40001|HYT00|HYT01)\b|\((1205|1222)\)|deadlock|lock request time ?out|database is locked",
+    re.IGNORECASE,
+)
+REPORT_COUNTERS = ('rows', 'batches', 'committed_batches', 'failed_batches', 'rows_affected', 'rows_unreported', 'retries', 'splits')
+
+log = get_logger('batch_writes')
+
+
+def chunked(items: list, size: int):
+    """Yield successive slices of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def new_report(label: str) -> dict:
+    """Return an empty write report, the shape execute_batches returns."""
+    report = {'label': label, **{counter: 0 for counter in REPORT_COUNTERS}}
+    report['failed_rows'] = []
+    return report
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Return True for errors worth retrying: deadlocks and lock or query timeouts.
+
+    Matches SQL Server errors 1205 (deadlock victim) and 1222 (lock request timeout),
+    SQLSTATE 40001 and HYT00/HYT01 (timeouts), and SQLite's "database is locked".
+    """
+    orig = getattr(error, 'orig', None) or error
+    return bool(TRANSIENT_ERROR_PATTERN.search(f"{orig} {getattr(orig, 'args', '')}"))
+
+
+def backoff_seconds(attempt: int, backoff: float = HIS_WRITE_BACKOFF_SECONDS) -> float:
+    """Jittered exponential backoff: a random wait of up to `backoff` * 2 ** `attempt` seconds."""
+    return random.uniform(0, backoff * 2 ** attempt)
+
+
+def run_with_retries(func, report: dict = None, retries: int = HIS_WRITE_RETRIES, backoff: float = HIS_WRITE_BACKOFF_SECONDS, label: str = 'write'):
+    """
+    Call `func()` and return its result, retrying transient errors after a jittered backoff.
+
+    Other errors, and a transient error after `retries` retries, are raised. Each retry is
+    counted in report['retries'] when a report is given.
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            if attempt >= retries or not is_transient_error(e):
+                raise
+            wait = backoff_seconds(attempt, backoff)
+            attempt += 1
+            if report is not None:
+                report['retries'] += 1
+            log.warning("%s: transient error, retry %d of %d in %.2fs: %s", label, attempt, retries, wait, getattr(e, 'orig', e))
+            time.sleep(wait)
+
+
+def next_batch_size(batch_size: int, seconds: float, rows: int, ok: bool, target_seconds: float = HIS_WRITE_TARGET_SECONDS, max_batch_size: int = HIS_WRITE_MAX_BATCH_SIZE) -> int:
+    """
+    Tune the batch size from the last batch's commit latency.
+
+    A failed batch or one slower than `target_seconds` halves the size; a full batch that
+    committed in under half the target doubles it, up to `max_batch_size`.
+    """
+    if not ok or seconds > target_seconds:
+        return max(batch_size // 2, 1)
+    if seconds < target_seconds / 2 and rows >= batch_size:
+        return min(batch_size * 2, max(int(max_batch_size), 1))
+    return batch_size
+
+
+def write_batch(cnxn: Engine, statement, batch: list[dict], report: dict, label: str, retries: int = HIS_WRITE_RETRIES, backoff: float = HIS_WRITE_BACKOFF_SECONDS, split: bool = True) -> bool:
+    """
+    Commit one batch in its own transaction, retrying transient errors.
+
+    With `split`, a batch that fails on a non-transient error (a bad row) is split in half and
+    each half is written the same way, so the rows that cannot be written end up alone in
+    report['failed_rows'] while the rest of the batch commits. A batch still hitting
+    deadlocks or lock timeouts after its retries is recorded as failed without splitting,
+    since smaller transactions would only wait on the same locks.
+
+    Returns:
+        bool: True when every row of the batch committed
+    """
+    def commit():
+        with cnxn.begin() as conn:
+            return conn.execute(statement, batch)
+
+    start = time.perf_counter()
+    try:
+        result = run_with_retries(commit, report, retries, backoff, label)
+    except Exception as e:
+        record_batch(time.perf_counter() - start)
+        if len(batch) == 1 or not split or is_transient_error(e):
+            report['failed_rows'].extend(batch)
+            log.warning("%s: %d rows rolled back: %s", label, len(batch), getattr(e, 'orig', e))
+            log.debug("%s: failed rows %s", label, batch)
+            return False
+        report['splits'] += 1
+        log.warning("%s: %d rows rolled back, splitting the batch to isolate failing rows: %s", label, len(batch), getattr(e, 'orig', e))
+        middle = len(batch) // 2
+        first_ok = write_batch(cnxn, statement, batch[:middle], report, label, retries, backoff)
+        second_ok = write_batch(cnxn, statement, batch[middle:], report, label, retries, backoff)
+        return first_ok and second_ok
+    record_batch(time.perf_counter() - start)
+    # Drivers report -1 when executemany cannot count the rows it touched.
+    if result.rowcount is not None and result.rowcount >= 0:
+        report['rows_affected'] += result.rowcount
+    else:
+        report['rows_unreported'] += len(batch)
+    return True
+
+
+def execute_batches(cnxn: Engine, sql: str, params: list[dict], batch_size: int, label: str = 'batch', adaptive: bool = HIS_WRITE_ADAPTIVE, retries: int = HIS_WRITE_RETRIES, split_failures: bool = True) -> dict:
+    """
+    Execute a parameterized statement as executemany batches, one transaction per batch.
+
+    Deadlocks and lock timeouts are retried with jittered backoff (run_with_retries). A batch
+    that still fails is split until the failing rows are isolated (write_batch), and the
+    remaining batches still run, so one bad row never undoes work that has already been
+    committed. With `adaptive`, the batch size starts at `batch_size` and follows the
+    observed commit latency (next_batch_size); the tuned size is returned as
+    report['batch_size'], so a run writing in several calls passes it to the next one.
+
+    Args:
+        cnxn: SQLAlchemy engine to write through
+        sql: Statement text with named bind parameters
+        params: One parameter dict per row
+        batch_size: Rows sent per executemany call (the starting size when adaptive,
+            usually the previous call's report['batch_size'])
+        label: Name used in log lines and the returned report
+        adaptive: Tune the batch size towards HIS_WRITE_TARGET_SECONDS per commit
+        retries: Retries of a batch that hit a transient error
+        split_failures: Split failing batches to isolate the failing rows
+
+    Returns:
+        dict: {'label', 'rows', 'batches', 'committed_batches', 'failed_batches',
+               'rows_affected', 'rows_unreported', 'failed_rows', 'retries', 'splits', 'batch_size'}
+    """
+    report = new_report(label)
+    report['rows'] = len(params)
+    size = report['batch_size'] = max(int(batch_size), 1)
+    if not params:
+        return report
+
+    statement = text(sql)
+    position = 0
+    while position < len(params):
+        batch = params[position:position + size]
+        position += len(batch)
+        report['batches'] += 1
+        start = time.perf_counter()
+        ok = write_batch(cnxn, statement, batch, report, label, retries, split=split_failures)
+        seconds = time.perf_counter() - start
+        if ok:
+            report['committed_batches'] += 1
+        else:
+            report['failed_batches'] += 1
+        log.debug("%s: batch %d %s (%d rows in %.3fs)", label, report['batches'], 'committed' if ok else 'had failed rows', len(batch), seconds)
+        if adaptive:
+            new_size = next_batch_size(size, seconds, len(batch), ok)
+            if new_size != size:
+                log.debug("%s: batch size %d -> %d", label, size, new_size)
+            size = new_size
+    report['batch_size'] = size
+    return report
+
+
+def combine_reports(reports: list[dict], label: str) -> dict:
+    """Add up several execute_batches reports into one, keeping the last tuned batch size."""
+    combined = new_report(label)
+    for report in reports:
+        for key in combined:
+            if key == 'label':
+                continue
+            combined[key] += report.get(key, [] if key == 'failed_rows' else 0)
+        if 'batch_size' in report:
+            combined['batch_size'] = report['batch_size']
+    return combined
+
+
+def log_batch_report(report: dict) -> None:
+    """Log a one-line summary of an execute_batches report."""
+    log.info(
+        "%s: %d rows in %d batches, %d committed, %d failed, %d rows affected%s",
+        report['label'], report['rows'], report['batches'], report['committed_batches'],
+        report['failed_batches'], report['rows_affected'],
+        f", {report['rows_unreported']} rows not counted by the driver" if report['rows_unreported'] else '',
+    )
+    if report.get('retries') or report.get('splits'):
+        log.info(
+            "%s: %d transient error retries, %d batches split, %d rows failed",
+            report['label'], report.get('retries', 0), report.get('splits', 0), len(report['failed_rows'])
+        )
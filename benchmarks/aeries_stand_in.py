@@ -0,0 +1,163 @@
+"""
+A local SQLite stand-in for the Aeries tables the SQL/ files use (HIS, CRS, STU), filled with
+synthetic students, courses and grades, plus matching college credit CSVs.
+"""
+import os
+import numpy as np
+from pandas import DataFrame
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from benchmarks.synthetic_data import make_dual_credit_rows
+from course_hour_mappings import COURSE_HOURS_MAPPING
+
+SCHEMA = [
+    # Column names are upper case like Aeries, so unaliased selects return PID, CN, ...
+    "create table CRS (CN varchar(10), TM varchar(1), DC varchar(1), CR float, CL int, DEL int)",
+    "create table STU (ID int, DEL int, TG varchar(1))",
+    """create table HIS (
+        PID int, CN varchar(10), MK varchar(3), CR float, CO varchar(30), GR int, TE int, YR int,
+        ST int, CC float, SQ int, SID int, SDE int, CH float, DEL int, SCH int
+    )""",
+    "create index his_pid_cn_sq on his (pid, cn, sq)",
+    "create index his_cn on his (cn)",
+    "create index crs_cn on crs (cn)",
+    "create index stu_id on stu (id)",
+]
+YEAR_LONG_COURSES = ['8250', '8250CE', '8250SD']
+UNMAPPED_COURSES = ['1101', '2202', '3303', '4404']
+SCHOOLS = [1, 2, 3, 20]
+COLLEGE_GRADES = ['A', 'B', 'C', 'P', 'D', 'F', 'NGR', 'NGR*', 'W']
+
+
+def create_stand_in_engine(path: str) -> Engine:
+    """Create a file SQLite engine in WAL mode, so streaming reads and batch writes can overlap."""
+    engine = create_engine(f'sqlite:///{path}?timeout=60')
+
+    @event.listens_for(engine, 'connect')
+    def set_wal(dbapi_connection, connection_record):
+        dbapi_connection.execute('PRAGMA journal_mode=WAL')
+        dbapi_connection.execute('PRAGMA synchronous=NORMAL')
+
+    return engine
+
+
+def make_crs_rows(seed: int = 0) -> DataFrame:
+    """One CRS row per mapped course plus a few unmapped ones; 8250 variants are year-long and about a quarter are ROP ('R')."""
+    rng = np.random.default_rng(seed)
+    courses = list(COURSE_HOURS_MAPPING.keys()) + UNMAPPED_COURSES
+    return DataFrame({
+        'CN': courses,
+        'TM': ['Y' if cn in YEAR_LONG_COURSES else rng.choice(['S', 'Y', ' ']) for cn in courses],
+        'DC': rng.choice(['R', 'X', 'E', 'M'], size=len(courses), p=[0.25, 0.25, 0.25, 0.25]),
+        'CR': rng.choice([5.0, 10.0], size=len(courses)),
+        'CL': 0,
+        'DEL': 0,
+    })
+
+
+def make_his_rows(n_rows: int, seed: int = 0) -> DataFrame:
+    """Synthetic HIS rows shaped like the dual credit query input, with unmapped and deleted rows mixed in."""
+    rng = np.random.default_rng(seed)
+    rows = make_dual_credit_rows(n_rows, seed=seed)
+    # About one row in ten is a course outside the mapping
+    unmapped = rng.random(len(rows)) < 0.1
+    rows.loc[unmapped, 'CN'] = rng.choice(UNMAPPED_COURSES, size=int(unmapped.sum()))
+    return DataFrame({
+        'PID': rows['PID'],
+        'CN': rows['CN'],
+        'MK': rows['MK'],
+        'CR': 5.0,
+        'CO': '',
+        'GR': rows['YR'] - 12,
+        'TE': rows['TE'],
+        'YR': rows['YR'],
+        'ST': 0,
+        'CC': 0.0,
+        'SQ': rows['SQ'],
+        'SID': 0,
+        'SDE': 0,
+        'CH': 0.0,
+        'DEL': (rng.random(len(rows)) < 0.01).astype(int),
+        'SCH': rng.choice(SCHOOLS, size=len(rows)),
+    })
+
+
+def make_college_csvs(directory: str, pids: np.ndarray, n_rows: int, seed: int = 0) -> tuple[str, str]:
+    """
+    Write a course map and a courses taken CSV for the college credit import.
+
+    Returns:
+        tuple: (courses_taken_path, course_map_path)
+    """
+    rng = np.random.default_rng(seed)
+    courses = list(COURSE_HOURS_MAPPING.keys())
+    crns = np.arange(40000, 40000 + len(courses))
+    course_map = DataFrame({
+        'CRN': crns,
+        'SLUSD Course Code': courses,
+        'Coll Units': rng.choice([1.5, 3.0, 4.0], size=len(courses)),
+        'Course Title (Long Title)': [f'College Course {cn}' for cn in courses],
+    })
+    # About one row in twenty has a CRN outside the map
+    taken_crns = np.where(rng.random(n_rows) < 0.05, 99999, rng.choice(crns, size=n_rows))
+    courses_taken = DataFrame({
+        'ID': rng.choice(pids, size=n_rows),
+        'CRN': taken_crns,
+        'GR': rng.choice([9, 10, 11, 12], size=n_rows),
+        'Grade (NGR = No Grade Received)': rng.choice(COLLEGE_GRADES, size=n_rows),
+    })
+    courses_taken_path = os.path.join(directory, 'courses_taken.csv')
+    course_map_path = os.path.join(directory, 'course_map.csv')
+    course_map.to_csv(course_map_path, index=False)
+    courses_taken.to_csv(courses_taken_path, index=False)
+    return courses_taken_path, course_map_path
+
+
+def build_stand_in(directory: str, n_rows: int, college_rows: int = None, seed: int = 0) -> dict:
+    """
+    Create and fill a SQLite stand-in in `directory`.
+
+    Args:
+        directory: Where the database and CSV files are written
+        n_rows: Approximate number of HIS rows
+        college_rows: Rows in the courses taken CSV (defaults to a tenth of n_rows)
+        seed: Random seed
+
+    Returns:
+        dict: {'engine', 'path', 'his_rows', 'students', 'courses_taken_path', 'course_map_path'}
+    """
+    path = os.path.join(directory, 'aeries.db')
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_stand_in_engine(path)
+    his = make_his_rows(n_rows, seed)
+    pids = his['PID'].unique()
+    rng = np.random.default_rng(seed)
+    stu = DataFrame({'ID': pids, 'DEL': 0, 'TG': np.where(rng.random(len(pids)) < 0.02, 'I', '')})
+
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+    make_crs_rows(seed).to_sql('CRS', engine, if_exists='append', index=False)
+    stu.to_sql('STU', engine, if_exists='append', index=False)
+    his.to_sql('HIS', engine, if_exists='append', index=False, chunksize=50000)
+
+    courses_taken_path, course_map_path = make_college_csvs(
+        directory, pids, college_rows if college_rows is not None else max(n_rows // 10, 1), seed
+    )
+    return {
+        'engine': engine,
+        'path': path,
+        'his_rows': len(his),
+        'students': len(pids),
+        'courses_taken_path': courses_taken_path,
+        'course_map_path': course_map_path,
+    }
+
+
+def reset_dual_credit_columns(engine: Engine) -> None:
+    """Put SDE, ST and CH back to their synthetic values so every benchmark variant does the same writes."""
+    with engine.begin() as conn:
+        conn.execute(text("update his set sde = 0, st = 0, ch = 0 where sid = 0"))
+        conn.execute(text("delete from his where sid = 11110"))
+        conn.execute(text("update crs set cl = 0"))
@@ -0,0 +1,122 @@
+"""
+Run the three entry points end to end against a synthetic SQLite stand-in for Aeries and
+report time and throughput per stage.
+
+    python -m benchmarks.end_to_end --rows 10000 100000 --workers 1 4 --apply-mode batch staged --pipeline
+
+Nothing connects to Aeries: the stand-in engine is registered with db.set_cnxn before any
+entry point runs. Checkpoints and run metrics go to the benchmark's scratch directory.
+"""
+import argparse
+import os
+import tempfile
+
+SCRATCH_DIR = os.environ.get('BENCHMARK_DIR') or tempfile.mkdtemp(prefix='dual_credit_bench_')
+# Keep benchmark checkpoints and metrics away from the nightly job's files
+os.environ['CHECKPOINT_DIR'] = os.path.join(SCRATCH_DIR, 'checkpoints')
+os.environ['METRICS_DIR'] = os.path.join(SCRATCH_DIR, 'metrics')
+
+from benchmarks.aeries_stand_in import build_stand_in, reset_dual_credit_columns
+from course_catalog import clear_course_catalog
+from db import get_cnxn, set_cnxn
+from insert_college_credit_courses import insert_college_credit_courses
+from main import update_dual_credit_hist
+from metrics import last_report
+from update_articulated_courses import update_articulated_courses
+
+PHASES = ['read', 'evaluate', 'write']
+
+
+def result_row(n_rows: int, job: str, variant: str, report: dict) -> dict:
+    rows = report['rows']
+    processed = rows.get('read', 0)
+    seconds = report['duration_seconds']
+    return {
+        'rows': n_rows,
+        'job': job,
+        'variant': variant,
+        'seconds': seconds,
+        'processed': processed,
+        'rows_per_second': processed / seconds if seconds else 0.0,
+        'written': rows.get('updated', 0) + rows.get('inserted', 0),
+        'round_trips': report['round_trips'],
+        'batch_p50_ms': report['batch_seconds'].get('p50', 0.0) * 1000,
+        **{phase: report['phases'].get(phase, 0.0) for phase in PHASES},
+    }
+
+
+def print_results(results: list[dict]) -> None:
+    print(
+        f"{'rows':>9} {'job':<19} {'variant':<28} {'seconds':>8} {'rows/s':>9} {'written':>8} "
+        f"{'trips':>6} {'p50 ms':>7} {'read':>7} {'eval':>7} {'write':>7}"
+    )
+    for result in results:
+        print(
+            f"{result['rows']:>9} {result['job']:<19} {result['variant']:<28} {result['seconds']:>8.2f} "
+            f"{result['rows_per_second']:>9.0f} {result['written']:>8} {result['round_trips']:>6} "
+            f"{result['batch_p50_ms']:>7.2f} {result['read']:>7.2f} {result['evaluate']:>7.2f} {result['write']:>7.2f}"
+        )
+
+
+def run_scale(n_rows: int, args: argparse.Namespace) -> list[dict]:
+    """Build a stand-in with about `n_rows` HIS rows and run every requested variant on it."""
+    directory = os.path.join(SCRATCH_DIR, f'rows_{n_rows}')
+    os.makedirs(directory, exist_ok=True)
+    stand_in = build_stand_in(directory, n_rows, seed=args.seed)
+    engine = stand_in['engine']
+    set_cnxn(engine)
+    clear_course_catalog()
+    assert get_cnxn() is engine
+    print(f"# {stand_in['his_rows']} HIS rows for {stand_in['students']} students in {stand_in['path']}")
+
+    variants = [
+        (f'{apply_mode}, {workers} worker(s)', {'apply_mode': apply_mode, 'workers': workers})
+        for apply_mode in args.apply_mode
+        for workers in args.workers
+    ]
+    if args.pipeline:
+        variants += [(f'{apply_mode}, pipeline', {'apply_mode': apply_mode, 'pipeline': True}) for apply_mode in args.apply_mode]
+
+    results = []
+    for variant, options in variants:
+        reset_dual_credit_columns(engine)
+        update_dual_credit_hist(chunk_size=args.chunk_size, **options)
+        results.append(result_row(n_rows, 'update-hist', variant, last_report()))
+        # A second pass finds nothing to change, which measures the read and evaluate cost alone
+        update_dual_credit_hist(chunk_size=args.chunk_size, **options)
+        results.append(result_row(n_rows, 'update-hist rerun', variant, last_report()))
+        # The parallel variants swap in a larger pool; go back to the stand-in engine
+        if get_cnxn() is not engine:
+            get_cnxn().dispose()
+            set_cnxn(engine)
+
+    update_articulated_courses()
+    results.append(result_row(n_rows, 'update-articulated', '', last_report()))
+    insert_college_credit_courses(
+        stand_in['courses_taken_path'],
+        course_map_path=stand_in['course_map_path'],
+        rejects_path=os.path.join(directory, 'rejects.csv'),
+    )
+    results.append(result_row(n_rows, 'import-college', '', last_report()))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000], help='HIS rows per scale')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1], help='worker counts to compare')
+    parser.add_argument('--apply-mode', nargs='+', default=['batch'], choices=['batch', 'staged'])
+    parser.add_argument('--pipeline', action='store_true', help='also run the pipelined variant')
+    parser.add_argument('--chunk-size', type=int, default=50_000, help='dual credit query rows read at a time')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for n_rows in args.rows:
+        results += run_scale(n_rows, args)
+    print_results(results)
+    print(f"# Databases, checkpoints and metrics are in {SCRATCH_DIR}")
+
+
+if __name__ == '__main__':
+    main()
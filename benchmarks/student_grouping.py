@@ -0,0 +1,59 @@
+"""
+Compare the per-student boolean-mask loop with the single sort + groupby walk.
+
+    python -m benchmarks.student_grouping --rows 10000 100000 1000000 --legacy-max 100000
+"""
+import argparse
+import time
+from pandas import DataFrame
+from benchmarks.synthetic_data import make_dual_credit_rows
+from dual_credit_rules import iter_student_years, sort_dual_credit_rows
+
+
+def walk_with_masks(data: DataFrame) -> int:
+    """The original loop: one boolean mask over the whole frame per student and per year."""
+    groups = 0
+    for pid in data['PID'].unique():
+        student_data = data[data['PID'] == pid].sort_values(by=['YR', 'TE'], ascending=[False, True])
+        for year in student_data['YR'].unique():
+            courses = student_data[student_data['YR'] == year]
+            groups += len(courses) > 0
+    return groups
+
+
+def walk_with_groupby(data: DataFrame) -> int:
+    """One sort plus one groupby over (PID, YR)."""
+    groups = 0
+    for _, years in iter_student_years(sort_dual_credit_rows(data)):
+        groups += len(years)
+    return groups
+
+
+def time_call(func, data: DataFrame) -> tuple[float, int]:
+    start = time.perf_counter()
+    groups = func(data)
+    return time.perf_counter() - start, groups
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='largest row count to run the quadratic mask loop on')
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'students':>9} {'groups':>8} {'mask loop (s)':>14} {'groupby (s)':>12} {'speedup':>8}")
+    for n_rows in args.rows:
+        data = make_dual_credit_rows(n_rows)
+        grouped_seconds, groups = time_call(walk_with_groupby, data)
+        if n_rows <= args.legacy_max:
+            mask_seconds, mask_groups = time_call(walk_with_masks, data)
+            assert mask_groups == groups
+            mask_text, speedup = f"{mask_seconds:14.2f}", f"{mask_seconds / grouped_seconds:7.1f}x"
+        else:
+            mask_text, speedup = f"{'skipped':>14}", f"{'-':>8}"
+        print(f"{len(data):>10} {data['PID'].nunique():>9} {groups:>8} {mask_text} {grouped_seconds:12.2f} {speedup}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import numpy as np
+from pandas import DataFrame
+from course_hour_mappings import COURSE_HOURS_MAPPING
+
+MARKS = ['A', 'A-', 'B+', 'B', 'C+', 'C', 'C-', 'D', 'F', 'P', 'NP']
+YEARS = [21, 22, 23, 24]
+
+
+def make_dual_credit_rows(n_rows: int, courses_per_year: int = 4, seed: int = 0) -> DataFrame:
+    """
+    Build a synthetic dual credit query result with roughly `n_rows` HIS rows.
+
+    Every student gets `courses_per_year` courses in each of YEARS, and half of the
+    courses are year-long (a term 1 and a term 2 record).
+
+    Returns:
+        DataFrame: PID, CN, SQ, YR, TE, MK, SDE, ST, CH columns like SQL.dual_credit_courses
+    """
+    rng = np.random.default_rng(seed)
+    rows_per_student = int(len(YEARS) * courses_per_year * 1.5)
+    n_students = max(n_rows // rows_per_student, 1)
+    courses = np.array(list(COURSE_HOURS_MAPPING.keys()))
+
+    pids = np.repeat(np.arange(100000, 100000 + n_students), len(YEARS) * courses_per_year)
+    years = np.tile(np.repeat(YEARS, courses_per_year), n_students)
+    cns = rng.choice(courses, size=len(pids))
+    year_long = rng.random(len(pids)) < 0.5
+
+    repeats = np.where(year_long, 2, 1)
+    frame = DataFrame({
+        'PID': np.repeat(pids, repeats),
+        'CN': np.repeat(cns, repeats),
+        'YR': np.repeat(years, repeats),
+    })
+    frame['TE'] = frame.groupby(['PID', 'YR', 'CN']).cumcount() + 1
+    frame['SQ'] = frame.groupby('PID').cumcount() + 1
+    frame['MK'] = rng.choice(MARKS, size=len(frame))
+    frame['SDE'] = 0
+    frame['ST'] = 0
+    frame['CH'] = 0.0
+    # Shuffle so the benchmark pays for sorting like the real query result would
+    frame = frame.sample(frac=1, random_state=seed).reset_index(drop=True)
+    return frame[['PID', 'CN', 'SQ', 'YR', 'TE', 'MK', 'SDE', 'ST', 'CH']]
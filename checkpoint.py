@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+from decouple import config
+from logs import get_logger
+
+CHECKPOINT_DIR = config('CHECKPOINT_DIR', default='checkpoints', cast=str)
+# Checkpoint fields holding sets, stored as sorted lists in the JSON file
+SET_FIELDS = ('completed_pids', 'completed_chunks')
+
+_LOCK = threading.Lock()
+
+log = get_logger('checkpoint')
+
+
+def checkpoint_path(job: str, database: str, scope: dict, directory: str = CHECKPOINT_DIR) -> str:
+    """
+    Return the checkpoint file for a job on a database.
+
+    The scope (filters, input file, ...) is hashed into the name, so a scoped rerun never
+    overwrites the checkpoint of a district-wide run.
+    """
+    digest = hashlib.sha1(json.dumps(scope, sort_keys=True, default=str).encode()).hexdigest()[:10]
+    return os.path.join(directory, f'{job}_{database}_{digest}.json')
+
+
+def new_checkpoint(job: str, database: str, scope: dict, path: str) -> dict:
+    now = datetime.now().isoformat(timespec='seconds')
+    return {
+        'job': job,
+        'database': database,
+        'scope': scope,
+        'path': path,
+        'started': now,
+        'updated': now,
+        'completed_pids': set(),
+        'completed_chunks': set(),
+        'committed_batches': 0,
+        'rows_affected': 0,
+    }
+
+
+def open_checkpoint(job: str, database: str, scope: dict, resume: bool = False, directory: str = CHECKPOINT_DIR) -> dict:
+    """
+    Start a checkpoint for a run, or pick up the previous one with `resume`.
+
+    Args:
+        job: Job name, e.g. 'update-hist'
+        database: Database the run writes to
+        scope: JSON-serializable run parameters that must match for a resume
+        resume: Load the existing checkpoint instead of starting over
+        directory: Directory holding checkpoint files
+
+    Returns:
+        dict: Checkpoint with completed_pids, completed_chunks, committed_batches and rows_affected
+    """
+    path = checkpoint_path(job, database, scope, directory)
+    if resume and os.path.exists(path):
+        with open(path) as f:
+            checkpoint = json.load(f)
+        for field in SET_FIELDS:
+            checkpoint[field] = set(checkpoint.get(field, []))
+        checkpoint['path'] = path
+        log.info(
+            "Resuming %s from %s: %d students and %d chunks already done",
+            job, path, len(checkpoint['completed_pids']), len(checkpoint['completed_chunks'])
+        )
+        return checkpoint
+    if resume:
+        log.info("No checkpoint found at %s; starting %s from the beginning", path, job)
+    return new_checkpoint(job, database, scope, path)
+
+
+def save_checkpoint(checkpoint: dict) -> None:
+    """Write the checkpoint atomically (temporary file, then rename) so a crash never leaves half a file."""
+    with _LOCK:
+        checkpoint['updated'] = datetime.now().isoformat(timespec='seconds')
+        data = {key: sorted(value) if key in SET_FIELDS else value for key, value in checkpoint.items() if key != 'path'}
+        directory = os.path.dirname(checkpoint['path']) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(temp_path, checkpoint['path'])
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def record_progress(checkpoint: dict, report: dict, pids=None, chunk: int = None) -> None:
+    """
+    Record finished work from an execute_batches-style report and save the checkpoint.
+
+    Students with a row in a failed batch, or a chunk with any failed batch, are not marked
+    complete, so a resumed run retries them.
+
+    Args:
+        checkpoint: Checkpoint from open_checkpoint
+        report: Write report with committed_batches, rows_affected and failed_rows
+        pids: Students the report covers
+        chunk: Input chunk number the report covers
+    """
+    with _LOCK:
+        failed_rows = report.get('failed_rows', [])
+        checkpoint['committed_batches'] += report.get('committed_batches', 0)
+        checkpoint['rows_affected'] += report.get('rows_affected', 0)
+        if pids is not None:
+            failed_pids = {int(row['pid']) for row in failed_rows if 'pid' in row}
+            checkpoint['completed_pids'] |= {int(pid) for pid in pids} - failed_pids
+        if chunk is not None and not report.get('failed_batches'):
+            checkpoint['completed_chunks'].add(int(chunk))
+    save_checkpoint(checkpoint)
+
+
+def finish_checkpoint(checkpoint: dict, complete: bool) -> None:
+    """Delete the checkpoint after a complete run; keep it (for --resume) when work is left."""
+    if complete:
+        if os.path.exists(checkpoint['path']):
+            os.remove(checkpoint['path'])
+    else:
+        save_checkpoint(checkpoint)
+        log.warning("Run incomplete; rerun with resume to continue from %s", checkpoint['path'])
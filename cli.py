@@ -0,0 +1,151 @@
+import argparse
+import sys
+from contextlib import nullcontext
+from decouple import Csv
+from main import (
+    DUAL_CREDIT_CHUNK_SIZE, DUAL_CREDIT_PIPELINE, DUAL_CREDIT_WORKERS, HIS_APPLY_MODE, HIS_APPLY_MODES,
+    HIS_DIFF_ONLY, HIS_WRITE_BATCH_SIZE, export_courses, update_dual_credit_hist,
+)
+from update_articulated_courses import update_articulated_courses
+from profiling import profile_run
+from logs import LOG_LEVEL, flush_logs, get_logger, setup_logging
+from multi_database import DATABASE_CONCURRENCY, DATABASES, run_databases
+from insert_college_credit_courses import (
+    COLLEGE_CSV_CHUNK_SIZE, COURSE_MAP_PATH, DEFAULT_SCHOOL_SDE, DEFAULT_SCHOOL_ST, insert_college_credit_courses,
+)
+
+log = get_logger('cli')
+
+
+def add_scope_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the --pid/--year/--since-year/--school filters pushed down into the dual credit query."""
+    parser.add_argument('--pid', dest='pids', type=int, action='extend', nargs='+', help='Only these student IDs')
+    parser.add_argument('--year', dest='years', type=int, action='extend', nargs='+', help='Only these school years (HIS YR)')
+    parser.add_argument('--since-year', type=int, help='Only school years from this one on')
+    parser.add_argument('--school', dest='schools', type=int, action='extend', nargs='+', help='Only these HIS school codes (SCH)')
+
+
+def run_update_hist(args: argparse.Namespace) -> int:
+    summary = update_dual_credit_hist(
+        batch_size=args.batch_size,
+        apply_mode=args.apply_mode,
+        diff_only=args.diff_only,
+        pids=args.pids,
+        years=args.years,
+        courses=args.courses,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        pipeline=args.pipeline,
+        since_year=args.since_year,
+        schools=args.schools,
+        resume=args.resume,
+    )
+    return 1 if summary.get('errors') or summary.get('writes', {}).get('failed_batches') else 0
+
+
+def run_update_articulated(args: argparse.Namespace) -> int:
+    update_articulated_courses(courses=args.courses)
+    return 0
+
+
+def run_import_college(args: argparse.Namespace) -> int:
+    report = insert_college_credit_courses(
+        courses_file_path=args.file,
+        school_taken=args.st,
+        school_dual_enrollment=args.sde,
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        rejects_path=args.rejects,
+        pids=args.pids,
+        resume=args.resume,
+        course_map_path=args.course_map,
+    )
+    return 1 if report['failed_batches'] else 0
+
+
+def run_export_course(args: argparse.Namespace) -> int:
+    export_courses(
+        args.courses,
+        output_dir=args.output_dir,
+        pids=args.pids,
+        years=args.years,
+        since_year=args.since_year,
+        schools=args.schools,
+        use_snapshot=args.snapshot or args.refresh_snapshot,
+        refresh_snapshot=args.refresh_snapshot,
+    )
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the argument parser with one subcommand per entry point."""
+    parser = argparse.ArgumentParser(prog='cli.py', description='Dual credit course maintenance for Aeries')
+    parser.add_argument('--profile', action='store_true', help='Trace SQL statements and log the slowest ones')
+    parser.add_argument('--profile-functions', action='store_true', help='With --profile, also run cProfile and dump a .prof file')
+    parser.add_argument('--log-level', default=LOG_LEVEL, type=str.upper, choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='DEBUG adds a line per student, course and write batch (defaults to LOG_LEVEL)')
+    parser.add_argument('--databases', type=Csv(), default=DATABASES, help='Comma-separated year databases to run on concurrently (defaults to DATABASES, else the configured database only)')
+    parser.add_argument('--concurrency', type=int, default=DATABASE_CONCURRENCY, help='With --databases, the most databases processed at once')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update_hist = subparsers.add_parser('update-hist', help='Update SDE/ST/CH on dual credit HIS records')
+    add_scope_arguments(update_hist)
+    update_hist.add_argument('--cn', dest='courses', action='extend', nargs='+', help='Only these course numbers')
+    update_hist.add_argument('--batch-size', type=int, default=HIS_WRITE_BATCH_SIZE, help='Rows per write batch (the starting size when HIS_WRITE_ADAPTIVE)')
+    update_hist.add_argument('--apply-mode', choices=HIS_APPLY_MODES, default=HIS_APPLY_MODE, help='HIS write strategy')
+    update_hist.add_argument('--chunk-size', type=int, default=DUAL_CREDIT_CHUNK_SIZE, help='Query rows read at a time (0 reads everything)')
+    update_hist.add_argument('--workers', type=int, default=DUAL_CREDIT_WORKERS, help='Worker threads')
+    update_hist.add_argument('--pipeline', action=argparse.BooleanOptionalAction, default=DUAL_CREDIT_PIPELINE, help='Overlap read, evaluate and write')
+    update_hist.add_argument('--diff-only', action=argparse.BooleanOptionalAction, default=HIS_DIFF_ONLY, help='Skip rows already up to date')
+    update_hist.add_argument('--resume', action='store_true', help='Skip students completed by the last unfinished run')
+    update_hist.set_defaults(func=run_update_hist)
+
+    articulated = subparsers.add_parser('update-articulated', help='Set CRS CL on articulated courses')
+    articulated.add_argument('--cn', dest='courses', action='extend', nargs='+', help='Only these course numbers')
+    articulated.set_defaults(func=run_update_articulated)
+
+    import_college = subparsers.add_parser('import-college', help='Insert HIS records from a college courses taken CSV')
+    import_college.add_argument('--file', default='in_data/chabot_courses_taken.csv', help='Courses taken CSV')
+    import_college.add_argument('--course-map', default=COURSE_MAP_PATH, help='College CRN to SLUSD course map CSV')
+    import_college.add_argument('--pid', dest='pids', type=int, action='extend', nargs='+', help='Only these student IDs')
+    import_college.add_argument('--st', type=int, default=DEFAULT_SCHOOL_ST, help='ST code for inserted records')
+    import_college.add_argument('--sde', type=int, default=DEFAULT_SCHOOL_SDE, help='SDE code for inserted records')
+    import_college.add_argument('--rejects', help='CSV path for rejected rows')
+    import_college.add_argument('--batch-size', type=int, default=HIS_WRITE_BATCH_SIZE, help='Rows per insert batch (the starting size when HIS_WRITE_ADAPTIVE)')
+    import_college.add_argument('--chunk-size', type=int, default=COLLEGE_CSV_CHUNK_SIZE, help='CSV rows read at a time')
+    import_college.add_argument('--resume', action='store_true', help='Skip CSV chunks completed by the last unfinished run')
+    import_college.set_defaults(func=run_import_college)
+
+    export_course = subparsers.add_parser('export-course', help='Export dual credit HIS rows for courses to CSV')
+    export_course.add_argument('--cn', dest='courses', action='extend', nargs='+', required=True, help='Course numbers to export')
+    add_scope_arguments(export_course)
+    export_course.add_argument('--output-dir', default='.', help='Directory for <course>.csv files (defaults to the current directory)')
+    export_course.add_argument('--snapshot', action='store_true', help='Read from the local Parquet snapshot (taken when missing or older than SNAPSHOT_TTL_MINUTES)')
+    export_course.add_argument('--refresh-snapshot', action='store_true', help='Take a new snapshot first, then read from it')
+    export_course.set_defaults(func=run_export_course)
+    return parser
+
+
+def main(argv: list[str] = None) -> int:
+    """Parse the command line, run the chosen subcommand and return its exit code."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.profile_functions and len(set(args.databases or [])) > 1:
+        # cProfile only sees the thread that enabled it, and each database runs on its own thread
+        parser.error("--profile-functions profiles a single thread; use it with at most one database")
+    setup_logging(args.log_level)
+    log.info("$"*80)
+    log.info("Starting %s", args.command)
+    profiler = profile_run(args.command, functions=args.profile_functions) if args.profile else nullcontext()
+    with profiler:
+        if args.databases:
+            report = run_databases(args.databases, lambda: args.func(args), args.concurrency)
+            status = 1 if report['status'] != 'success' or any(report['results'].values()) else 0
+        else:
+            status = args.func(args)
+    log.info("$"*80)
+    flush_logs()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import threading
+from pandas import isna, read_sql_query
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from batch_writes import chunked
+from db import get_database
+from logs import get_logger
+
+CATALOG_COLUMNS = ['TM', 'DC', 'CR', 'CL']
+ROP_DEPARTMENT_CODE = 'R'
+# SQL Server allows ~2100 bind parameters per statement
+MAX_IN_LIST = 1000
+
+_SNAPSHOTS: dict[str, dict] = {}
+_LOADED: dict[str, set] = {}
+_LOCK = threading.Lock()
+
+log = get_logger('course_catalog')
+
+
+def normalize_courses(courses) -> set[str]:
+    """Return the distinct, non-empty course numbers as strings."""
+    return {str(cn) for cn in courses if cn is not None and cn == cn and str(cn) != ''}
+
+
+def load_course_catalog(cnxn: Engine, sql: str, courses) -> dict:
+    """
+    Load CN, TM, DC, CR and CL for the given courses from CRS.
+
+    Args:
+        cnxn: Engine to read from
+        sql: SQL.course_catalog (expects an expanding :cn_list parameter)
+        courses: Course numbers to load
+
+    Returns:
+        dict: {cn: {'TM': ..., 'DC': ..., 'CR': ..., 'CL': ...}}
+    """
+    courses = sorted(normalize_courses(courses))
+    statement = text(sql).bindparams(bindparam('cn_list', expanding=True))
+    catalog = {}
+    for cn_list in chunked(courses, MAX_IN_LIST):
+        frame = read_sql_query(statement, cnxn, params={'cn_list': cn_list})
+        frame['CN'] = frame['CN'].astype(str)
+        catalog.update(frame.drop_duplicates('CN').set_index('CN')[CATALOG_COLUMNS].to_dict('index'))
+    missing = set(courses) - set(catalog)
+    if missing:
+        log.warning("%d courses not found in CRS: %s", len(missing), ', '.join(sorted(missing)))
+    return catalog
+
+
+def get_course_catalog(cnxn: Engine, sql: str, courses) -> dict:
+    """
+    Return the shared CRS snapshot for this database, loading any courses not seen yet.
+
+    Every caller on the same database shares one snapshot, so a course is read from
+    CRS at most once per run no matter how many lookups are made.
+    """
+    key = get_database()
+    with _LOCK:
+        catalog = _SNAPSHOTS.setdefault(key, {})
+        loaded = _LOADED.setdefault(key, set())
+        missing = normalize_courses(courses) - loaded
+        if missing:
+            log.info("Loading CRS catalog for %d courses", len(missing))
+            catalog.update(load_course_catalog(cnxn, sql, missing))
+            loaded |= missing
+    return catalog
+
+
+def load_course_classifications(cnxn: Engine, sql: str, courses) -> dict:
+    """
+    Read the current CL of every CRS row of the given courses, bypassing the shared snapshot.
+
+    Every row is read, deleted ones included, because the CL update writes all of them.
+
+    Args:
+        cnxn: Engine to read from
+        sql: SQL.course_classifications (expects an expanding :cn_list parameter)
+        courses: Course numbers to read
+
+    Returns:
+        dict: {cn: [CL of each CRS row]} for the courses found in CRS
+    """
+    statement = text(sql).bindparams(bindparam('cn_list', expanding=True))
+    classifications: dict = {}
+    for cn_list in chunked(sorted(normalize_courses(courses)), MAX_IN_LIST):
+        frame = read_sql_query(statement, cnxn, params={'cn_list': cn_list})
+        for cn, cl in zip(frame['CN'].astype(str), frame['CL']):
+            classifications.setdefault(cn, []).append(cl)
+    return classifications
+
+
+def set_course_classification(cn: str, cl: int) -> None:
+    """Record a CL written to CRS in this database's snapshot, if the course is loaded."""
+    with _LOCK:
+        info = _SNAPSHOTS.get(get_database(), {}).get(str(cn))
+        if info is not None:
+            info['CL'] = cl
+
+
+def clear_course_catalog() -> None:
+    """Drop every cached snapshot so the next lookup reloads from CRS."""
+    with _LOCK:
+        _SNAPSHOTS.clear()
+        _LOADED.clear()
+
+
+def get_course_term(catalog: dict, cn: str):
+    """Return the CRS term type (TM) for a course, or None when the course is not in CRS."""
+    info = catalog.get(str(cn))
+    return info['TM'] if info else None
+
+
+def get_location_st(catalog: dict, cn: str, default_st: int, rop_st: int) -> int:
+    """Return the ST code for a course: the ROP location for department 'R', otherwise the default school."""
+    info = catalog.get(str(cn))
+    if info is None or isna(info['DC']):
+        log.warning("No location code found for course %s. Defaulting to %s.", cn, default_st)
+        return default_st
+    return rop_st if info['DC'] == ROP_DEPARTMENT_CODE else default_st
@@ -48,6 +48,12 @@ COURSE_HOURS_MAPPING = {
     "L8000":	2,
     }
 
+# CRS CL (course classification) for mapped courses: articulated, except the
+# college credit only courses below
+ARTICULATED_CL = 24
+COLLEGE_CREDIT_ONLY_CL = 23
+COLLEGE_CREDIT_ONLY_COURSES = ['4141', '4142']
+
 def get_course_hours(course_number) -> float:
     """
     Get credit hours for a course number.
@@ -62,4 +68,20 @@ def get_course_hours(course_number) -> float:
 
 def get_all_courses():
     """Return all course numbers that have mappings."""
-    return list(COURSE_HOURS_MAPPING.keys())
\ No newline at end of file
+    return list(COURSE_HOURS_MAPPING.keys())
+
+def get_course_classification(course_number) -> int:
+    """
+    Get the CRS CL a mapped course should have.
+    
+    Args:
+        course_number (str): The course number to look up
+        
+    Returns:
+        int: COLLEGE_CREDIT_ONLY_CL for college credit only courses, ARTICULATED_CL for other
+             mapped courses, or None if the course is not mapped
+    """
+    course_number = str(course_number)
+    if course_number not in COURSE_HOURS_MAPPING:
+        return None
+    return COLLEGE_CREDIT_ONLY_CL if course_number in COLLEGE_CREDIT_ONLY_COURSES else ARTICULATED_CL
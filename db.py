@@ -0,0 +1,119 @@
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decouple import config
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from slusdlib import aeries, core
+from logs import get_logger, log_context
+
+_LOCK = threading.RLock()
+_SQL = None
+_ENGINES: dict[str, Engine] = {}
+# Set by use_database so concurrent runs on different databases each see their own
+_ACTIVE_DATABASE: ContextVar[str] = ContextVar('active_database', default=None)
+
+log = get_logger('db')
+
+
+def get_database() -> str:
+    """
+    Return the database the current run works on: the one selected with use_database, otherwise
+    the configured one (TEST_DATABASE when TEST is set, otherwise DATABASE).
+    """
+    active = _ACTIVE_DATABASE.get()
+    if active:
+        return active
+    if config('TEST', cast=bool) == False:
+        return config('DATABASE', cast=str)
+    return config('TEST_DATABASE', cast=str)
+
+
+def get_school_year(database: str = None) -> int:
+    """Return the two-digit school year in a year database name, e.g. 24 for DST24000SLUSD."""
+    return int((database or get_database())[3:5])
+
+
+@contextmanager
+def use_database(database: str):
+    """
+    Make `database` the current database for this thread (and the workers it starts).
+
+    get_database, get_cnxn, and everything keyed by them (catalog, checkpoints, metrics,
+    snapshots) follow the selection, and log lines are prefixed with the database name.
+    """
+    token = _ACTIVE_DATABASE.set(database)
+    try:
+        with log_context(database):
+            yield get_cnxn(database)
+    finally:
+        _ACTIVE_DATABASE.reset(token)
+
+
+def get_sql():
+    """Return the shared SQL object, building it from the SQL directory on first use."""
+    global _SQL
+    with _LOCK:
+        if _SQL is None:
+            _SQL = core.build_sql_object()
+        return _SQL
+
+
+def get_cnxn(database: str = None) -> Engine:
+    """
+    Return the shared write engine for a database, creating it on first use.
+
+    Every module asks the registry for its engine, so importing a module never connects and
+    a run uses one pooled engine per database.
+
+    Args:
+        database: Database name (defaults to get_database())
+    """
+    database = database or get_database()
+    with _LOCK:
+        if database not in _ENGINES:
+            _ENGINES[database] = aeries.get_aeries_cnxn(database=database, access_level='w')
+        return _ENGINES[database]
+
+
+def set_cnxn(cnxn: Engine, database: str = None) -> None:
+    """Register an engine for a database, e.g. a local SQLite stand-in for tests and benchmarks."""
+    with _LOCK:
+        _ENGINES[database or get_database()] = cnxn
+
+
+def ensure_pool_size(pool_size: int, database: str = None) -> Engine:
+    """Make the shared engine for a database able to hold `pool_size` connections and return it."""
+    database = database or get_database()
+    with _LOCK:
+        current = get_cnxn(database)
+        sized = sized_engine(current, pool_size)
+        if sized is not current:
+            _ENGINES[database] = sized
+            current.dispose()
+        return sized
+
+
+def sized_engine(cnxn: Engine, pool_size: int) -> Engine:
+    """
+    Return an engine whose connection pool can hold `pool_size` connections at once.
+
+    Engines whose QueuePool is already large enough, and engines without a QueuePool
+    (e.g. SQLite), are returned unchanged. Otherwise a new engine is created on the same
+    URL with a pool sized for the workers, so threads never queue for a connection.
+    """
+    pool = cnxn.pool
+    if not isinstance(pool, QueuePool) or pool.size() >= pool_size:
+        return cnxn
+    log.info("Creating engine with a pool of %d connections for parallel processing", pool_size)
+    options = {}
+    if getattr(cnxn.dialect, 'fast_executemany', False):
+        options['fast_executemany'] = True
+    return create_engine(
+        cnxn.url,
+        pool_size=pool_size,
+        max_overflow=0,
+        pool_pre_ping=True,
+        **options,
+    )
@@ -0,0 +1,112 @@
+from pandas import DataFrame, concat, read_sql_query
+from sqlalchemy import bindparam, text
+from sqlalchemy.engine import Engine
+from course_hour_mappings import get_all_courses
+
+DUAL_CREDIT_COLUMNS = ['PID', 'CN', 'SQ', 'YR', 'TE', 'MK', 'SDE', 'ST', 'CH']
+DUAL_CREDIT_DTYPES = {
+    'PID': 'int32',
+    'SQ': 'int32',
+    'YR': 'int16',
+    'TE': 'int16',
+    'SDE': 'int16',
+    'ST': 'int16',
+    'CH': 'float32',
+    'CN': 'category',
+}
+# Optional filters: (keyword argument, SQL clause, bind parameter, list-valued)
+DUAL_CREDIT_FILTERS = [
+    ('pids', 'AND his.pid in :pid_list', 'pid_list', True),
+    ('years', 'AND his.yr in :yr_list', 'yr_list', True),
+    ('since_year', 'AND his.yr >= :since_year', 'since_year', False),
+    ('schools', 'AND his.sch in :sch_list', 'sch_list', True),
+]
+
+
+def build_dual_credit_query(sql: str, courses: list[str] = None, pids: list[int] = None, years: list[int] = None, since_year: int = None, schools: list[int] = None) -> tuple:
+    """
+    Build SQL.dual_credit_courses with its course list and optional filters bound as parameters.
+
+    Args:
+        sql: SQL.dual_credit_courses (with a {filters} placeholder)
+        courses: Course numbers to select (defaults to every course in COURSE_HOURS_MAPPING)
+        pids: Only these students
+        years: Only these school years
+        since_year: Only school years from this one on
+        schools: Only records from these HIS school codes (SCH)
+
+    Returns:
+        tuple: (statement, params) ready for read_sql_query
+    """
+    values = {'pids': pids, 'years': years, 'since_year': since_year, 'schools': schools}
+    params = {'cn_list': [str(cn) for cn in (courses if courses else get_all_courses())]}
+    clauses = []
+    expanding = [bindparam('cn_list', expanding=True)]
+    for keyword, clause, name, is_list in DUAL_CREDIT_FILTERS:
+        value = values[keyword]
+        if value is None or (is_list and not value):
+            continue
+        clauses.append(clause)
+        if is_list:
+            params[name] = [int(item) for item in value]
+            expanding.append(bindparam(name, expanding=True))
+        else:
+            params[name] = int(value)
+    statement = text(sql.format(filters='\n    '.join(clauses))).bindparams(*expanding)
+    return statement, params
+
+
+def compact_dual_credit_frame(frame: DataFrame) -> DataFrame:
+    """Downcast the dual credit columns; integer columns holding NULLs use the nullable Int types."""
+    dtypes = {}
+    for column, dtype in DUAL_CREDIT_DTYPES.items():
+        if column not in frame:
+            continue
+        if dtype.startswith('int') and frame[column].isna().any():
+            dtype = dtype.capitalize()
+        dtypes[column] = dtype
+    return frame.astype(dtypes)
+
+
+def read_dual_credit_courses(cnxn: Engine, sql: str, courses: list[str] = None, pids: list[int] = None, years: list[int] = None, since_year: int = None, schools: list[int] = None) -> DataFrame:
+    """Run the dual credit query with the given filters and return a compact frame."""
+    statement, params = build_dual_credit_query(sql, courses=courses, pids=pids, years=years, since_year=since_year, schools=schools)
+    return compact_dual_credit_frame(read_sql_query(statement, cnxn, params=params))
+
+
+def iter_student_chunks(chunks):
+    """
+    Re-cut PID-ordered chunks so no student is split across two frames.
+
+    The rows of the last student in each chunk are held back and prepended to the next
+    chunk, so every yielded frame holds complete students.
+    """
+    carry = None
+    for chunk in chunks:
+        if carry is not None and not carry.empty:
+            chunk = concat([carry, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+        last_student = chunk['PID'] == chunk['PID'].iloc[-1]
+        carry = chunk[last_student]
+        if not last_student.all():
+            yield chunk[~last_student]
+    if carry is not None and not carry.empty:
+        yield carry
+
+
+def stream_dual_credit_courses(cnxn: Engine, sql: str, chunk_size: int, courses: list[str] = None, pids: list[int] = None, years: list[int] = None, since_year: int = None, schools: list[int] = None):
+    """
+    Stream the dual credit query in chunks of about `chunk_size` rows, one or more whole students per frame.
+
+    The query is ordered by PID and read through a server-side cursor, so peak memory is
+    bounded by the chunk size and callers can start writing before the read finishes.
+
+    Yields:
+        DataFrame: Compact frames (see compact_dual_credit_frame) of complete students
+    """
+    statement, params = build_dual_credit_query(sql, courses=courses, pids=pids, years=years, since_year=since_year, schools=schools)
+    with cnxn.connect().execution_options(stream_results=True) as conn:
+        chunks = read_sql_query(statement, conn, params=params, chunksize=max(int(chunk_size), 1))
+        for students in iter_student_chunks(chunks):
+            yield compact_dual_credit_frame(students)
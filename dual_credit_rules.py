@@ -0,0 +1,231 @@
+import numpy as np
+from pandas import DataFrame, Series, to_numeric
+from course_hour_mappings import COURSE_HOURS_MAPPING
+from logs import get_logger
+
+C_OR_BETTER_PREFIXES = ('A', 'B', 'C')
+ONE_SEMESTER_C_COURSES = ['8250']
+GROUP_KEYS = ['PID', 'YR', 'CN']
+
+log = get_logger('dual_credit_rules')
+
+
+def sort_dual_credit_rows(data: DataFrame) -> DataFrame:
+    """Sort once by PID, then newest year first, then term (stable, so ties keep query order)."""
+    return data.sort_values(by=['PID', 'YR', 'TE'], ascending=[True, False, True], kind='mergesort')
+
+
+def iter_student_years(data: DataFrame):
+    """
+    Walk a sort_dual_credit_rows frame student by student with a single groupby.
+
+    Yields:
+        tuple: (pid, [(year, courses), ...]) with years newest first
+    """
+    current_pid, student_years = None, []
+    for (pid, year), courses in data.groupby(['PID', 'YR'], sort=False):
+        if student_years and pid != current_pid:
+            yield current_pid, student_years
+            student_years = []
+        current_pid = pid
+        student_years.append((year, courses))
+    if student_years:
+        yield current_pid, student_years
+
+
+def is_passing_grade(grade: str) -> bool:
+    """Check if a grade is passing (A, B, C, or P)."""
+    if not grade:
+        return False
+    grade = str(grade).upper().strip()
+    return (grade.startswith('A') or
+            grade.startswith('B') or
+            grade.startswith('C') or
+            grade == 'P')
+
+
+def check_year_long_pass(courses: DataFrame, course_terms: dict) -> dict:
+    """
+    Check if a student has passed both semesters of year-long courses.
+    
+    Per-student reference implementation of the pass rules; update_dual_credit_hist
+    evaluates the whole result at once with evaluate_dual_credit_courses.
+    Special handling:
+    - Course 8250 variants: only need C or better in one semester
+    - Regular year-long courses: pass if second semester is passed (even if first failed)
+    
+    Args:
+        courses: DataFrame of courses for a student in a specific year
+        course_terms: Dictionary mapping course numbers to term types
+        
+    Returns:
+        dict: Dictionary mapping course numbers to pass status
+              {course_number: {'passed': bool, 'semesters': [semester_data]}}
+    """
+    course_status = {}
+    
+    # Group courses by course number (CN)
+    course_groups = courses.groupby('CN')
+    
+    for cn, course_group in course_groups:
+        # Check if this course has both semester 1 and 2
+        terms = course_group['TE'].unique()
+        
+        if (len(terms) == 2 and set(terms) == {1, 2}) or course_terms.get(cn, None) == 'Y':
+            # This is a year-long course
+            semester_data = []
+            
+            for _, row in course_group.iterrows():
+                grade = row.get('MK', '')  
+                passed = is_passing_grade(grade)
+                semester_data.append({
+                    'semester': row.get('TE', ''),  # TE is the term/semester
+                    'term': row.get('TE', ''),
+                    'grade': grade,
+                    'passed': passed
+                })
+            
+            # Special handling for course 8250 variants
+            if cn in ['8250']:
+                # For 8250 variants, only need C or better in one semester
+                c_or_better_grades = []
+                for sem_data in semester_data:
+                    grade = sem_data['grade'].upper().strip() if sem_data['grade'] else ''
+                    if grade.startswith('A') or grade.startswith('B') or grade.startswith('C'):
+                        c_or_better_grades.append(sem_data)
+                
+                passed_8250 = len(c_or_better_grades) >= 1
+                course_status[cn] = {
+                    'passed': passed_8250,
+                    'semesters': semester_data,
+                    'is_year_long': True
+                }
+                
+                log.debug("8250 variant course %s: %s - needs C or better in one semester", cn, 'PASSED' if passed_8250 else 'FAILED')
+                
+            else:
+                # Regular year-long courses: pass if second semester is passed
+                # Find semester 1 and 2 data
+                sem1_data = next((sem for sem in semester_data if sem['semester'] == 1), None)
+                sem2_data = next((sem for sem in semester_data if sem['semester'] == 2), None)
+                
+                # Course passes if second semester is passed
+                if sem2_data and sem2_data['passed']:
+                    course_passed = True
+                    if sem1_data and not sem1_data['passed']:
+                        log.debug("Year-long course %s: PASSED - failed first semester but passed second semester", cn)
+                    else:
+                        log.debug("Year-long course %s: PASSED - passed second semester", cn)
+                else:
+                    course_passed = False
+                    log.debug("Year-long course %s: FAILED - did not pass second semester", cn)
+                
+                course_status[cn] = {
+                    'passed': course_passed,
+                    'semesters': semester_data,
+                    'is_year_long': True
+                }
+            
+        else:
+            # Single semester course
+            row = course_group.iloc[0]  
+            grade = row.get('MK', '')
+            passed = is_passing_grade(grade)
+            
+            course_status[cn] = {
+                'passed': passed,
+                'semesters': [{'semester': row.get('TE', ''), 'term': row.get('TE', ''), 'grade': grade, 'passed': passed}],
+                'is_year_long': False
+            }
+            
+            log.debug("Single semester course %s: %s", cn, 'PASSED' if passed else 'FAILED')
+    
+    return course_status
+
+
+def normalize_marks(marks: Series) -> Series:
+    """Upper-case and strip marks, treating missing values as an empty mark."""
+    return marks.fillna('').astype(str).str.upper().str.strip()
+
+
+def evaluate_dual_credit_courses(data: DataFrame, course_terms: dict) -> DataFrame:
+    """
+    Evaluate pass/fail for every HIS row of the dual credit query at once.
+
+    Applies the same rules as check_year_long_pass, grouped by (PID, YR, CN):
+    - A course is year-long when it has exactly terms 1 and 2, or CRS marks it 'Y'
+    - Course 8250 (year-long): passes with C or better in either semester
+    - Other year-long courses: pass when the first semester 2 record is passing
+    - Single semester courses: pass when the first record is passing
+
+    Row order within each group decides "first", so sort by term beforehand.
+
+    Args:
+        data: Rows with at least PID, YR, CN, TE and MK
+        course_terms: Dictionary mapping course numbers to term types
+
+    Returns:
+        DataFrame: `data` with PASSED, IS_YEAR_LONG and CREDIT_HOURS columns added.
+                   CREDIT_HOURS is NaN for unmapped courses and halved for passed year-long courses.
+    """
+    result = data.copy()
+    if result.empty:
+        return result.assign(PASSED=Series(dtype=bool), IS_YEAR_LONG=Series(dtype=bool), CREDIT_HOURS=Series(dtype=float))
+
+    cn = result['CN'].astype(str)
+    marks = normalize_marks(result['MK'])
+    c_or_better = marks.str.startswith(C_OR_BETTER_PREFIXES)
+    row_passed = c_or_better | (marks == 'P')
+    # Plain floats keep the comparisons below NaN-safe whatever integer dtype TE arrived as
+    term = to_numeric(result['TE'], errors='coerce').astype(float)
+    # Factorize (PID, YR, CN) once so every rule below groups on a single integer key
+    keys = result.assign(CN=cn).groupby(GROUP_KEYS, sort=False, dropna=False).ngroup()
+
+    both_semesters = (
+        term.isin([1, 2]).groupby(keys).transform('all')
+        & (term.groupby(keys).transform('nunique') == 2)
+    )
+    is_year_long = both_semesters | (cn.map(course_terms) == 'Y')
+
+    first_passed = row_passed.groupby(keys).transform('first').astype(bool)
+    # 'first' skips NaN, so masking non-semester-2 rows picks the first semester 2 record
+    semester_two_passed = row_passed.where(term == 2).groupby(keys).transform('first')
+    semester_two_passed = semester_two_passed.fillna(False).astype(bool)
+    any_c_or_better = c_or_better.groupby(keys).transform('any').astype(bool)
+
+    one_semester_c = is_year_long & cn.isin(ONE_SEMESTER_C_COURSES)
+    passed = first_passed.where(~is_year_long, semester_two_passed).where(~one_semester_c, any_c_or_better)
+
+    credit_hours = cn.map(COURSE_HOURS_MAPPING).astype(float)
+    credit_hours = credit_hours.where(~(passed & is_year_long), credit_hours / 2)
+
+    result['PASSED'] = passed.astype(bool)
+    result['IS_YEAR_LONG'] = is_year_long.astype(bool)
+    result['CREDIT_HOURS'] = credit_hours
+    return result
+
+
+def differs_from_target(current: DataFrame, target: DataFrame, compare_ch: Series) -> Series:
+    """
+    Flag rows whose current SDE/ST (and CH where `compare_ch`) differ from the target values.
+
+    Missing current values always count as different.
+
+    Args:
+        current: Frame with the SDE, ST and CH values already in HIS
+        target: Frame with the same index and sde, st, credit_hours columns
+        compare_ch: Boolean Series, True where CH is part of the update
+
+    Returns:
+        Series: True for rows that need a write
+    """
+    current_sde = to_numeric(current['SDE'], errors='coerce').astype(float)
+    current_st = to_numeric(current['ST'], errors='coerce').astype(float)
+    current_ch = to_numeric(current['CH'], errors='coerce').astype(float)
+    target_ch = to_numeric(target['credit_hours'], errors='coerce').astype(float)
+
+    sde_differs = current_sde.isna() | (current_sde != to_numeric(target['sde'], errors='coerce').astype(float))
+    st_differs = current_st.isna() | (current_st != to_numeric(target['st'], errors='coerce').astype(float))
+    ch_matches = Series(np.isclose(current_ch, target_ch), index=current.index)
+    ch_differs = compare_ch & ~ch_matches
+    return sde_differs | st_differs | ch_differs
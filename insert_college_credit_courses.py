@@ -1,151 +1,301 @@
-import math
-from pandas import read_csv, read_sql_query
-from slusdlib import aeries, core, decorators
-from sqlalchemy import text
+import os
+import numpy as np
+from pandas import DataFrame, Series, read_csv, read_sql_query, to_numeric
+from functools import cache
+from slusdlib import core, decorators
+from sqlalchemy import bindparam, text
 from decouple import config
-from icecream import ic
-from course_hour_mappings import COURSE_HOURS_MAPPING
+from db import get_cnxn, get_database, get_school_year, get_sql
+from checkpoint import finish_checkpoint, open_checkpoint, record_progress
+from logs import get_logger
+from metrics import add_outcomes, add_rows, timed, timed_iter, track_run
+from course_catalog import MAX_IN_LIST, get_course_catalog
+from batch_writes import chunked, combine_reports, execute_batches, log_batch_report
 
-SQL = core.build_sql_object()
-CNXN = aeries.get_aeries_cnxn(database=config('DATABASE', cast=str), access_level='w') if config('TEST', cast=bool) == False else aeries.get_aeries_cnxn(database=config('TEST_DATABASE', cast=str), access_level='w')
 DEFAULT_SCHOOL_ST = 20 #config('DEFAULT_SCHOOL_ST', cast=int) 
 DEFAULT_SCHOOL_SDE = config('DEFAULT_SCHOOL_SDE', cast=int) 
 ROP_LOCATION_CODE_ST = config('ROP_LOCATION_CODE_ST', cast=int)
+HIS_WRITE_BATCH_SIZE = config('HIS_WRITE_BATCH_SIZE', default=500, cast=int)
+COLLEGE_CSV_CHUNK_SIZE = config('COLLEGE_CSV_CHUNK_SIZE', default=50000, cast=int)
 PASSING_MARKS = ['A', 'B', 'C', 'P']
-COURSE_MAP = read_csv('in_data/chabot_course_map.csv')\
-    .set_index('CRN')[['SLUSD Course Code', 'Coll Units','Course Title (Long Title)']]\
-    .to_dict('index')
-    # .apply(lambda x: {'SLUSD_course_code': x[0], 'Coll Units': x[1]}, axis=1)\
+GRADE_COLUMN = 'Grade (NGR = No Grade Received)'
+COURSE_MAP_PATH = 'in_data/chabot_course_map.csv'
 
-def get_distilled_mark(mark: str) -> str:
-    if mark in PASSING_MARKS:
-        return mark
-    elif 'NGR' in mark:
-        return 'NGR'
-    else:
-        raise ValueError(f"Unexpected grade value: {mark}")
-    
-def get_next_sq(pid: int = None, id: int = None, table: str = 'his') -> int:
-    if pid:
-        sql = text(f"""
-                select 
-                top 1 
-                sq
-                from {table} 
-                where pid = :pid
-                order by sq desc
-                """)
-        last_sq = read_sql_query(sql, CNXN, params={'pid': pid})['sq'].iloc[0]
-        return int(last_sq + 1) if last_sq is not None else 1
-    elif id:
-        sql = text(f"""
-                select 
-                top 1 
-                sq
-                from {table} 
-                where id = :id
-                order by sq desc
-                """)
-        last_sq = read_sql_query(sql, CNXN, params={'id': id})['sq'].iloc[0]
-        return int(last_sq + 1) if last_sq is not None else 1
+log = get_logger('insert_college_credit_courses')
 
-def insert_new_his_record(pid: int, cn: str, mk: str, cr: float, gr: int,  yr: int, st: int, cc: float, sq: int, sde: int, ch: float, sid:int = 11110, co:str = '', te: int = 1) -> None:
-    params = {
-        "pid": int(pid),
-        "cn": str(cn),
-        "co": str(co), 
-        "mk": str(mk),
-        "cr": float(cr),
-        "gr": int(gr),
-        "te": int(te), 
-        "yr": int(yr),
-        "st": int(st),
-        "cc": float(cc),
-        "sq": int(sq),
-        "sid": int(sid),
-        "sde": int(sde),
-        "ch": float(ch)
-    }
-    
-    # Debug logging
-    # print(f"DEBUG - Parameters being passed:")
-    # for key, value in params.items():
-    #     print(f"  {key}: {value} (type: {type(value)})")
+def normalize_code(codes: Series) -> Series:
+    """Normalize CRNs / course codes to strings so numeric and text CSV columns compare equal."""
+    return codes.astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+
+def load_course_map(path: str = COURSE_MAP_PATH) -> DataFrame:
+    """Load the college CRN to SLUSD course map as a frame keyed by a normalized CRN column."""
+    course_map = read_csv(path)[['CRN', 'SLUSD Course Code', 'Coll Units', 'Course Title (Long Title)']]
+    course_map['CRN'] = normalize_code(course_map['CRN'])
+    return course_map.drop_duplicates('CRN')
+
+@cache
+def get_course_map(path: str = COURSE_MAP_PATH) -> DataFrame:
+    """Load a course map on first use so importing this module stays cheap."""
+    return load_course_map(path)
+
+def distill_marks(marks: Series) -> Series:
+    """Distill college marks: passing marks are kept, NGR variants become 'NGR', anything else None."""
+    marks = marks.fillna('').astype(str).str.strip()
+    ngr = np.where(marks.str.contains('NGR', regex=False), 'NGR', None)
+    return marks.where(marks.isin(PASSING_MARKS), Series(ngr, index=marks.index))
+
+def prepare_college_courses(courses: DataFrame, course_map: DataFrame = None) -> tuple[DataFrame, DataFrame]:
+    """
+    Clean one chunk of the college courses CSV and map it to SLUSD courses in a single merge.
     
-    with CNXN.connect() as conn:
-        sql = text(SQL.insert_his_record)
-        try:
-            conn.execute(sql, params)
-            conn.commit()
-            core.log(f"Successfully inserted new record for PID: {pid}, CN: {cn}, SQ: {sq}")
-        except Exception as e:
-            core.log(f"Error inserting record: {e}")
-            raise
-@decorators.log_function_timer
-def insert_college_credit_courses(courses_file_path: str = 'in_data/chabot_courses_taken.csv',  school_taken:int = DEFAULT_SCHOOL_ST, school_dual_enrollment:int = DEFAULT_SCHOOL_SDE) -> None:
-    all_courses = read_csv(courses_file_path)
-    yr = config('DATABASE', cast=str)[3:5]
-    passed_courses = all_courses[all_courses['Grade (NGR = No Grade Received)'].isin(PASSING_MARKS)]
-    for index, row in passed_courses.iterrows():
+    Args:
+        courses: Rows from the courses taken CSV (ID, CRN, GR and the grade column)
+        course_map: Frame from load_course_map (defaults to get_course_map())
         
-        slusd_id = row.get('ID', None)
-        core.log(f" Processing row {index} with Student ID: {slusd_id} ".center(80, '#'))
-        if slusd_id is None or slusd_id == '' or math.isnan(slusd_id) or slusd_id == 'nan':
-            core.log(f"Skipping row {index} because 'ID' is missing.")
-            continue
-        college_course_number = row['CRN']
+    Returns:
+        tuple: (prepared, rejects). `prepared` has ROW, PID, CN, MK, GR, CH and CO columns for
+               insert-ready rows; `rejects` has the original columns plus ROW and REASON
+               ('invalid grade', 'NGR', 'missing ID', 'unmapped CRN' or 'missing GR').
+    """
+    course_map = course_map if course_map is not None else get_course_map()
+    frame = courses.assign(
+        ROW=courses.index,
+        PID=to_numeric(courses['ID'], errors='coerce'),
+        MK=distill_marks(courses[GRADE_COLUMN]),
+        GR=to_numeric(courses['GR'], errors='coerce'),
+        CRN_KEY=normalize_code(courses['CRN']),
+    )
+    frame = frame.merge(
+        course_map.rename(columns={'CRN': 'CRN_KEY'}),
+        on='CRN_KEY',
+        how='left',
+        suffixes=('', '_MAP'),
+    )
+    
+    reason = Series(None, index=frame.index, dtype=object)
+    # Checks run from least to most important so the first failing check wins
+    reason = reason.mask(frame['GR'].isna(), 'missing GR')
+    reason = reason.mask(frame['SLUSD Course Code'].isna(), 'unmapped CRN')
+    reason = reason.mask(frame['PID'].isna(), 'missing ID')
+    reason = reason.mask(frame['MK'] == 'NGR', 'NGR')
+    reason = reason.mask(frame['MK'].isna(), 'invalid grade')
+    
+    rejected = reason.notna()
+    rejects = frame.loc[rejected, list(courses.columns) + ['ROW']].assign(REASON=reason[rejected])
+    
+    accepted = frame[~rejected]
+    titles = accepted['Course Title (Long Title)'].fillna('').astype(str).str[:30]
+    prepared = DataFrame({
+        'ROW': accepted['ROW'],
+        'PID': accepted['PID'].astype(int),
+        'CN': normalize_code(accepted['SLUSD Course Code']),
+        'MK': accepted['MK'].astype(str),
+        'GR': accepted['GR'].astype(float).astype(int),
+        'CH': to_numeric(accepted['Coll Units'], errors='coerce').fillna(0.0).astype(float),
+        'CO': titles,
+    })
+    return prepared.reset_index(drop=True), rejects.reset_index(drop=True)
+
+def get_next_sqs(pids) -> dict[int, int]:
+    """
+    Get the next free HIS sequence number for every student in one grouped query.
+    
+    Args:
+        pids: Student IDs to look up
         
+    Returns:
+        dict: {pid: next_sq}, 1 for students without any HIS records
+    """
+    pids = sorted({int(pid) for pid in pids})
+    next_sqs = {pid: 1 for pid in pids}
+    statement = text(get_sql().max_his_sq).bindparams(bindparam('pid_list', expanding=True))
+    for pid_list in chunked(pids, MAX_IN_LIST):
+        max_sqs = read_sql_query(statement, get_cnxn(), params={'pid_list': pid_list})
+        for pid, max_sq in zip(max_sqs['PID'], max_sqs['SQ']):
+            if max_sq is not None and max_sq == max_sq:
+                next_sqs[int(pid)] = int(max_sq) + 1
+    return next_sqs
+
+def his_key(pid: int, cn: str, yr: int, sde: int) -> tuple[int, str, int, int]:
+    """Normalize the (PID, CN, YR, SDE) identity of a college credit HIS record."""
+    return (int(pid), str(cn).strip(), int(yr), int(sde))
 
-        slusd_course_code = COURSE_MAP[college_course_number]['SLUSD Course Code'] if college_course_number in COURSE_MAP else None
+def get_existing_his_keys(pids) -> set[tuple[int, str, int, int]]:
+    """
+    Load the (PID, CN, YR, SDE) keys of every active HIS record for the given students in one query.
+    
+    Args:
+        pids: Student IDs to look up
         
-        # if slusd_course_code is None or (type(slusd_course_code) == float and math.isnan(slusd_course_code)):
-        #     slusd_course_code = '60001C'
+    Returns:
+        set: his_key tuples already present in HIS
+    """
+    pids = sorted({int(pid) for pid in pids})
+    keys = set()
+    statement = text(get_sql().existing_his_keys).bindparams(bindparam('pid_list', expanding=True))
+    for pid_list in chunked(pids, MAX_IN_LIST):
+        existing = read_sql_query(statement, get_cnxn(), params={'pid_list': pid_list})
+        existing = existing.dropna(subset=['PID', 'CN', 'YR', 'SDE'])
+        keys.update(his_key(*row) for row in existing[['PID', 'CN', 'YR', 'SDE']].itertuples(index=False))
+    return keys
+
+def allocate_sq(next_sqs: dict[int, int], pid: int) -> int:
+    """Hand out the next sequence number for a student and advance the counter."""
+    sq = next_sqs.get(pid, 1)
+    next_sqs[pid] = sq + 1
+    return sq
+
+def build_his_insert_records(prepared: DataFrame, catalog: dict, next_sqs: dict[int, int], existing_keys: set, yr: int, school_taken: int, school_dual_enrollment: int) -> tuple[list[dict], int]:
+    """
+    Turn prepared rows into SQL.insert_his_record parameters.
+    
+    Rows whose (PID, CN, YR, SDE) key is already in `existing_keys` are dropped, SQs are
+    handed out from `next_sqs` in row order, and both are updated in place so the next
+    chunk sees this chunk's inserts.
+    
+    Returns:
+        tuple: (records, duplicates)
+    """
+    if prepared.empty:
+        return [], 0
+    keys = [his_key(pid, cn, yr, school_dual_enrollment) for pid, cn in zip(prepared['PID'], prepared['CN'])]
+    is_duplicate = Series([key in existing_keys for key in keys], index=prepared.index)
+    is_duplicate |= Series(keys, index=prepared.index).duplicated()
+    existing_keys.update(keys)
+    rows = prepared[~is_duplicate]
+    if rows.empty:
+        return [], int(is_duplicate.sum())
+    
+    credits = Series({cn: info['CR'] for cn, info in catalog.items()}, dtype=float)
+    credits_possible = rows['CN'].map(credits).fillna(5.00)
+    first_sq = rows['PID'].map(lambda pid: next_sqs.get(pid, 1))
+    sq = first_sq + rows.groupby('PID').cumcount()
+    for pid, last_sq in sq.groupby(rows['PID']).max().items():
+        next_sqs[int(pid)] = int(last_sq) + 1
+    
+    inserts = DataFrame({
+        "pid": rows['PID'],
+        "cn": rows['CN'],
+        "co": rows['CO'],
+        "mk": rows['MK'],
+        "cr": credits_possible,
+        "gr": rows['GR'],
+        "te": 1,
+        "yr": int(yr),
+        "st": int(school_taken),
+        # Only passing marks reach this point, so credits complete equals credits possible
+        "cc": credits_possible,
+        "sq": sq.astype(int),
+        "sid": 11110,
+        "sde": int(school_dual_enrollment),
+        "ch": rows['CH'],
+    })
+    return inserts.to_dict('records'), int(is_duplicate.sum())
+
+@track_run('import-college')
+@decorators.log_function_timer
+def insert_college_credit_courses(courses_file_path: str = 'in_data/chabot_courses_taken.csv',  school_taken:int = DEFAULT_SCHOOL_ST, school_dual_enrollment:int = DEFAULT_SCHOOL_SDE, batch_size: int = HIS_WRITE_BATCH_SIZE, chunk_size: int = COLLEGE_CSV_CHUNK_SIZE, rejects_path: str = None, pids: list[int] = None, resume: bool = False, course_map_path: str = COURSE_MAP_PATH) -> dict:
+    """
+    Insert HIS records for the passed college courses in a courses taken CSV.
+    
+    The CSV is read in chunks of `chunk_size` rows so large multi-college files stay within
+    bounded memory. Each chunk is prepared with prepare_college_courses, checked against the
+    HIS keys and SQs of its students (loaded once per student), and inserted in batches.
+    
+    Chunks whose batches all committed are recorded in a checkpoint file. With `resume`,
+    chunks completed by an earlier run over the same file and settings are skipped; a
+    partly inserted chunk is rerun and its existing rows are skipped as duplicates.
+    
+    Args:
+        courses_file_path: Courses taken CSV
+        school_taken: ST code for the inserted records
+        school_dual_enrollment: SDE code for the inserted records
+        batch_size: Rows per insert batch
+        chunk_size: CSV rows read at a time
+        rejects_path: Optional CSV path to write rejected rows to
+        pids: Only insert records for these students
+        resume: Skip chunks completed by the last unfinished run with the same settings
+        course_map_path: College CRN to SLUSD course map CSV
         
-        course_info = read_sql_query(text(SQL.course_info), CNXN, params={'cn': slusd_course_code})
-        mark = get_distilled_mark(row['Grade (NGR = No Grade Received)']) 
-        grade = int(float(row['GR']))
-        # if slusd_id is None or (type(slusd_course_code) == float and math.isnan(slusd_course_code)):
-        #     core.log(f"Skipping row {index} because 'ID' or 'SLUSD Course Code' is missing.")
-        #     continue
-        if mark not in PASSING_MARKS:
-            if mark == 'NGR':
-                core.log(f"Skipping row {index} because 'Grade' is NGR (No Grade Received).")
-                continue
-            core.log(f"Skipping row {index} because 'Grade' is not valid: {mark}")
+    Returns:
+        dict: Combined execute_batches report plus 'duplicates', 'rejects' (counts by reason)
+              and 'skipped_chunks' (completed by a previous run)
+    """
+    yr = get_school_year()
+    catalog = get_course_catalog(get_cnxn(), get_sql().course_catalog, normalize_code(get_course_map(course_map_path)['SLUSD Course Code'].dropna()))
+    next_sqs: dict[int, int] = {}
+    existing_keys: set = set()
+    loaded_pids: set[int] = set()
+    reports: list[dict] = []
+    reject_counts: dict[str, int] = {}
+    duplicates = 0
+    skipped_chunks = 0
+    scope = {
+        'file': os.path.abspath(courses_file_path), 'chunk_size': int(chunk_size), 'pids': pids,
+        'st': school_taken, 'sde': school_dual_enrollment,
+    }
+    checkpoint = open_checkpoint('import-college', get_database(), scope, resume=resume)
+    append_rejects = bool(checkpoint['completed_chunks'])
+    
+    chunks = timed_iter(read_csv(courses_file_path, chunksize=max(int(chunk_size), 1)), 'read')
+    for chunk_number, chunk in enumerate(chunks, start=1):
+        if chunk_number in checkpoint['completed_chunks']:
+            skipped_chunks += 1
             continue
+        add_rows('read', len(chunk))
+        with timed('evaluate'):
+            prepared, rejects = prepare_college_courses(chunk, get_course_map(course_map_path))
+            if pids:
+                prepared = prepared[prepared['PID'].isin([int(pid) for pid in pids])]
+        log.debug("Chunk %d: %d rows ready, %d rejected", chunk_number, len(prepared), len(rejects))
+        for reason, count in rejects['REASON'].value_counts().items():
+            reject_counts[reason] = reject_counts.get(reason, 0) + int(count)
+        if rejects_path and not rejects.empty:
+            rejects.to_csv(rejects_path, mode='a' if append_rejects else 'w', header=not append_rejects, index=False)
+            append_rejects = True
         
-        credits_possible = course_info['CR'].iloc[0] if not course_info.empty else 5.00
-        term = course_info['TM'].iloc[0] if not course_info.empty else 1
-        credits_complete = credits_possible if mark in PASSING_MARKS else 0.00
-        next_sq = get_next_sq(slusd_id)
-        ch = COURSE_MAP[college_course_number]['Coll Units'] # if slusd_course_code in COURSE_MAP else 0.00
-        co = COURSE_MAP[college_course_number]['Course Title (Long Title)'][:30] if COURSE_MAP[college_course_number]['Course Title (Long Title)'] else ''
-        print(f'co: {co}')
-        
-        core.log(f"Inserting course for SLUSD ID: {slusd_id}, Course Code: {slusd_course_code}, Grade: {mark}, Credits Possible: {credits_possible}, Credits Complete: {credits_complete}, Next SQ: {next_sq}")
-        
-        core.log(f"Course info for {slusd_course_code}: CR = {credits_possible}, ch = {ch}")
-        
-        
-        core.log(f"Processing row {index}: SLUSD ID: {slusd_id}, College Course Number: {college_course_number}, SLUSD Course Code: {slusd_course_code}, Grade: {mark}")
-        insert_new_his_record(
-            pid=int(slusd_id),
-            cn=str(slusd_course_code),
-            mk=str(mark),
-            cr=float(credits_possible),
-            co=str(co),  
-            gr=int(grade),               
-            # te=int(term),               
-            yr=int(yr),                 
-            st=int(school_taken),       
-            cc=float(credits_complete), 
-            sq=int(next_sq),           
-            sde=int(school_dual_enrollment), 
-            ch=float(ch)             
-        )
-        
+        # Students are looked up once, the first time they appear in the file
+        new_pids = set(prepared['PID']) - loaded_pids
+        if new_pids:
+            with timed('read'):
+                next_sqs.update(get_next_sqs(new_pids))
+                existing_keys |= get_existing_his_keys(new_pids)
+            loaded_pids |= new_pids
         
+        with timed('evaluate'):
+            records, chunk_duplicates = build_his_insert_records(
+                prepared, catalog, next_sqs, existing_keys, yr, school_taken, school_dual_enrollment
+            )
+        duplicates += chunk_duplicates
+        log.debug("Chunk %d: inserting %d HIS records, skipped %d already in HIS", chunk_number, len(records), chunk_duplicates)
+        with timed('write'):
+            chunk_report = execute_batches(get_cnxn(), get_sql().insert_his_record, records, batch_size, label=f'HIS inserts chunk {chunk_number}')
+        # The next chunk starts at the size this one was tuned to
+        batch_size = chunk_report['batch_size']
+        record_progress(checkpoint, chunk_report, chunk=chunk_number)
+        reports.append(chunk_report)
     
+    report = combine_reports(reports, label='HIS inserts')
+    report['duplicates'] = duplicates
+    report['rejects'] = reject_counts
+    report['skipped_chunks'] = skipped_chunks
+    finish_checkpoint(checkpoint, complete=not report['failed_batches'])
+    # Rows the driver could not count (rowcount -1) were still committed
+    inserted = report['rows_affected'] + report['rows_unreported']
+    add_rows('inserted', inserted)
+    add_rows('skipped', duplicates)
+    add_rows('rejected', sum(reject_counts.values()))
+    add_rows('failed', len(report['failed_rows']))
+    add_outcomes({
+        'inserted': inserted,
+        'already in HIS': duplicates,
+        **{f'rejected: {reason}': count for reason, count in reject_counts.items()},
+    })
+    if skipped_chunks:
+        log.info("Skipped %d chunks completed by the previous run", skipped_chunks)
+    log_batch_report(report)
+    log.info("Skipped %d rows already in HIS; rejected rows by reason: %s", duplicates, reject_counts)
+    return report
 
 if __name__ == "__main__":
     core.log("$"*80)
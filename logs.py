@@ -0,0 +1,129 @@
+import atexit
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from decouple import config
+
+LOG_LEVEL = config('LOG_LEVEL', default='INFO', cast=str)
+LOGGER_NAME = 'dual_credit'
+
+_LOCK = threading.Lock()
+_QUEUE: queue.Queue = queue.Queue()
+_LISTENER = None
+_CONTEXT: ContextVar[str] = ContextVar('log_context', default='')
+
+
+class CoreLogHandler(logging.Handler):
+    """
+    Hand formatted records to slusdlib's core.log, so log output goes where it always has.
+    slusdlib is imported when the writer starts, so modules that only log (e.g. the pass
+    rules) import without it.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        from slusdlib import core
+        self.core = core
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.core.log(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+
+class ContextFilter(logging.Filter):
+    """Stamp each record with the caller's log context, e.g. the database of a concurrent run."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _CONTEXT.get()
+        record.context = f'[{context}] ' if context else ''
+        return True
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Queue records unformatted. The message is built from its arguments by the listener
+    thread, so the calling thread only pays for creating the record. The listener is
+    started by the first record, so library use (e.g. find_course from a shell) logs
+    without calling setup_logging first.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if _LISTENER is None:
+            start_listener()
+        super().emit(record)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return the logger for a module; the writer thread only starts once something is logged."""
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+
+@contextmanager
+def log_context(label: str):
+    """Prefix log lines written in this block (and by workers started from it) with `label`."""
+    token = _CONTEXT.set(label)
+    try:
+        yield
+    finally:
+        _CONTEXT.reset(token)
+
+
+def start_listener() -> None:
+    """Start the background writer thread if it is not running."""
+    global _LISTENER
+    with _LOCK:
+        if _LISTENER is not None:
+            return
+        handler = CoreLogHandler()
+        handler.setFormatter(logging.Formatter('%(levelname)s %(context)s%(message)s'))
+        _LISTENER = QueueListener(_QUEUE, handler)
+        _LISTENER.start()
+        atexit.register(stop_logging)
+
+
+def setup_logging(level: str = None) -> None:
+    """
+    Set the log level and start the background writer thread ahead of the first record.
+
+    Safe to call more than once; the level only changes when one is given. Per-row detail is
+    logged at DEBUG, so it costs nothing unless LOG_LEVEL=DEBUG.
+    """
+    if level:
+        logging.getLogger(LOGGER_NAME).setLevel(level.upper())
+    start_listener()
+
+
+def _configure_logger() -> None:
+    """Route the application's loggers through the queue; no thread is started here."""
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(LOG_LEVEL.upper())
+    queue_handler = LazyQueueHandler(_QUEUE)
+    queue_handler.addFilter(ContextFilter())
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+
+
+def flush_logs() -> None:
+    """Block until the writer thread has written every queued record."""
+    if _LISTENER is not None:
+        _QUEUE.join()
+
+
+def stop_logging() -> None:
+    """Write the remaining records and stop the writer thread."""
+    global _LISTENER
+    with _LOCK:
+        if _LISTENER is not None:
+            _LISTENER.stop()
+            _LISTENER = None
+
+
+_configure_logger()
@@ -1,255 +1,431 @@
-from pandas import DataFrame, read_sql_query
-from slusdlib import aeries, core, decorators
-from course_hour_mappings import COURSE_HOURS_MAPPING, get_course_hours
+import logging
+import os
+import sys
+import time
+from pandas import DataFrame, Series, isna
+from slusdlib import core, decorators
+from course_hour_mappings import get_all_courses
+from course_catalog import get_course_catalog, get_course_term, get_location_st
+from dual_credit_query import read_dual_credit_courses, stream_dual_credit_courses
+from db import ensure_pool_size, get_cnxn, get_database, get_sql
+from checkpoint import finish_checkpoint, open_checkpoint, record_progress
+from logs import get_logger
+from metrics import add_outcomes, add_rows, record_batch, timed, timed_iter, track_run
+from snapshot import get_snapshot, read_snapshot
+from parallel import run_in_pool
+from pipeline import log_pipeline_stats, run_pipeline
 from update_articulated_courses import update_articulated_courses
+from batch_writes import chunked, combine_reports, execute_batches, log_batch_report, new_report, run_with_retries
+from dual_credit_rules import differs_from_target, evaluate_dual_credit_courses, iter_student_years, sort_dual_credit_rows
 from sqlalchemy import text
 from decouple import config
 
-SQL = core.build_sql_object()
-CNXN = aeries.get_aeries_cnxn(database=config('DATABASE', cast=str), access_level='w') if config('TEST', cast=bool) == False else aeries.get_aeries_cnxn(database=config('TEST_DATABASE', cast=str), access_level='w')
 DEFAULT_SCHOOL_ST = config('DEFAULT_SCHOOL_ST', cast=int) 
 DEFAULT_SCHOOL_SDE = config('DEFAULT_SCHOOL_SDE', cast=int) 
 ROP_LOCATION_CODE_ST = config('ROP_LOCATION_CODE_ST', cast=int)
+HIS_WRITE_BATCH_SIZE = config('HIS_WRITE_BATCH_SIZE', default=500, cast=int)
+HIS_APPLY_MODE = config('HIS_APPLY_MODE', default='batch', cast=str)
+HIS_APPLY_MODES = ('batch', 'staged')
+HIS_DIFF_ONLY = config('HIS_DIFF_ONLY', default=True, cast=bool)
+DUAL_CREDIT_CHUNK_SIZE = config('DUAL_CREDIT_CHUNK_SIZE', default=50000, cast=int)
+DUAL_CREDIT_WORKERS = config('DUAL_CREDIT_WORKERS', default=1, cast=int)
+DUAL_CREDIT_PIPELINE = config('DUAL_CREDIT_PIPELINE', default=False, cast=bool)
+PIPELINE_QUEUE_SIZE = config('PIPELINE_QUEUE_SIZE', default=2, cast=int)
 
-def update_his_record(pid: int, cn: str, sq: str, credit_hours: float, sde: int = 16, st: int = DEFAULT_SCHOOL_ST) -> None:
-    """Update a single HIS record with dual credit information including credit hours."""
-    core.log(f"Updating HIS record (with credit hours) for PID: {pid}, CN: {cn}, SQ: {sq}")
-    try:
-        with CNXN.connect() as conn:
-            conn.execute(
-                text(SQL.update_his_dual_credit_pass),
-                {
-                    "sde": sde,
-                    "st": st,
-                    "pid": pid,
-                    "cn": cn,
-                    "sq": sq,
-                    "credit_hours": credit_hours
-                }
-            )
-            conn.commit()
-            core.log(f"Successfully updated record with credit hours")
-    except Exception as e:
-        core.log(f"Error updating record for PID {pid}: {e}")
-        CNXN.rollback()
-        raise
+log = get_logger('main')
 
-def update_his_record_sde_st_only(pid: int, cn: str, sq: str, sde: int = 16, st: int = DEFAULT_SCHOOL_ST) -> None:
-    """Update a single HIS record with only SDE and ST (for failed courses)."""
-    core.log(f"Updating HIS record (SDE/ST only) for PID: {pid}, CN: {cn}, SQ: {sq}")
-    try:
-        with CNXN.connect() as conn:
-            conn.execute(
-                text(SQL.update_his_dual_credit_fail),
-                {
-                    "sde": sde,
-                    "st": st,
-                    "pid": pid,
-                    "cn": cn,
-                    "sq": sq
-                }
-            )
-            conn.commit()
-            core.log(f"Successfully updated record with SDE/ST only")
-    except Exception as e:
-        core.log(f"Error updating SDE/ST for PID {pid}: {e}")
-        CNXN.rollback()
-        raise
+def build_his_updates(evaluated: DataFrame, location_st: dict, sde: int = 16, diff_only: bool = HIS_DIFF_ONLY) -> tuple[list[dict], list[dict], dict]:
+    """
+    Turn an evaluate_dual_credit_courses frame into pass/fail update parameters.
+    
+    Rows for courses without a credit hour mapping are skipped. With `diff_only`, rows whose
+    SDE, ST (and CH for passed courses) already hold the target values are skipped too.
+    
+    Args:
+        evaluated: Frame returned by dual_credit_rules.evaluate_dual_credit_courses
+        location_st: Dictionary mapping course numbers to the ST code to write
+        sde: SDE code to write
+        diff_only: Only emit updates for rows that differ from their target
+        
+    Returns:
+        tuple: (pass_updates, fail_updates, counts) where counts holds
+               'unmapped', 'unchanged' and 'changed' row counts
+    """
+    mapped = evaluated[evaluated['CREDIT_HOURS'].notna()]
+    updates = DataFrame({
+        "sde": sde,
+        "st": mapped['CN'].astype(str).map(location_st),
+        "pid": mapped['PID'].astype(int),
+        "cn": mapped['CN'].astype(str),
+        "sq": mapped['SQ'].astype(int),
+        "credit_hours": mapped['CREDIT_HOURS'].astype(float),
+    })
+    passed = mapped['PASSED'].astype(bool)
+    if diff_only:
+        changed = differs_from_target(mapped, updates, compare_ch=passed)
+    else:
+        changed = Series(True, index=mapped.index)
+    counts = {
+        'unmapped': len(evaluated) - len(mapped),
+        'unchanged': int((~changed).sum()),
+        'changed': int(changed.sum()),
+    }
+    pass_updates = updates[passed & changed].to_dict('records')
+    fail_updates = updates[~passed & changed].drop(columns=['credit_hours']).to_dict('records')
+    return pass_updates, fail_updates, counts
 
-def is_passing_grade(grade: str) -> bool:
-    """Check if a grade is passing (A, B, C, or P)."""
-    if not grade:
-        return False
-    grade = str(grade).upper().strip()
-    return (grade.startswith('A') or 
-            grade.startswith('B') or 
-            grade.startswith('C') or 
-            grade == 'P')
-  
+def flush_his_updates(pass_updates: list[dict], fail_updates: list[dict], batch_size: int = HIS_WRITE_BATCH_SIZE, cnxn=None) -> dict:
+    """
+    Write the collected pass/fail HIS updates as executemany batches.
+    
+    Each batch runs in its own transaction and is rolled back on its own if it fails. The
+    fail updates start at the batch size the pass updates were tuned to.
     
-def check_year_long_pass(courses: DataFrame, course_terms: dict) -> dict:
+    Returns:
+        dict: {'pass': report, 'fail': report} as returned by batch_writes.execute_batches
+    """
+    cnxn = cnxn if cnxn is not None else get_cnxn()
+    reports = {'pass': execute_batches(cnxn, get_sql().update_his_dual_credit_pass, pass_updates, batch_size, label='HIS pass updates')}
+    reports['fail'] = execute_batches(cnxn, get_sql().update_his_dual_credit_fail, fail_updates, reports['pass']['batch_size'], label='HIS fail updates')
+    for report in reports.values():
+        log_batch_report(report)
+    return reports
+
+def his_stage_names(cnxn) -> dict:
+    """Return the dialect-specific DDL keyword and name for the HIS staging table."""
+    if cnxn.dialect.name == 'mssql':
+        return {"create_table": "CREATE TABLE", "stage": "#his_dual_credit_stage"}
+    return {"create_table": "CREATE TEMP TABLE", "stage": "his_dual_credit_stage"}
+
+def apply_his_updates_staged(pass_updates: list[dict], fail_updates: list[dict], batch_size: int = HIS_WRITE_BATCH_SIZE, cnxn=None) -> dict:
     """
-    Check if a student has passed both semesters of year-long courses.
-    Special handling:
-    - Course 8250 variants: only need C or better in one semester
-    - Regular year-long courses: pass if second semester is passed (even if first failed)
+    Apply the collected HIS updates with one set-based UPDATE joined to a staging table.
+    
+    The target (PID, CN, SQ, SDE, ST, CH) rows are bulk loaded into a temp table and
+    applied in a single statement, all inside one transaction. Failed courses are staged
+    with a NULL CH so their existing credit hours are kept.
     
     Args:
-        courses: DataFrame of courses for a student in a specific year
-        course_terms: Dictionary mapping course numbers to term types
+        pass_updates: {'pid', 'cn', 'sq', 'sde', 'st', 'credit_hours'} parameters from build_his_updates
+        fail_updates: {'pid', 'cn', 'sq', 'sde', 'st'} parameters from build_his_updates
+        batch_size: Rows per executemany call while loading the staging table
+        cnxn: Engine to write through (defaults to the shared engine; any dialect with UPDATE ... FROM, e.g. SQLite)
         
     Returns:
-        dict: Dictionary mapping course numbers to pass status
-              {course_number: {'passed': bool, 'semesters': [semester_data]}}
+        dict: Report shaped like batch_writes.execute_batches, with the staged rows as one batch
     """
-    course_status = {}
+    cnxn = cnxn if cnxn is not None else get_cnxn()
+    staged = pass_updates + [{**update, "credit_hours": None} for update in fail_updates]
+    report = new_report('HIS staged updates')
+    report['rows'] = len(staged)
+    if not staged:
+        return report
     
-    # Group courses by course number (CN)
-    course_groups = courses.groupby('CN')
+    names = his_stage_names(cnxn)
     
-    for cn, course_group in course_groups:
-        # Check if this course has both semester 1 and 2
-        terms = course_group['TE'].unique()
-        
-        if (len(terms) == 2 and set(terms) == {1, 2}) or course_terms.get(cn, None) == 'Y':
-            # This is a year-long course
-            semester_data = []
-            
-            for _, row in course_group.iterrows():
-                grade = row.get('MK', '')  
-                passed = is_passing_grade(grade)
-                semester_data.append({
-                    'semester': row.get('TE', ''),  # TE is the term/semester
-                    'term': row.get('TE', ''),
-                    'grade': grade,
-                    'passed': passed
-                })
-            
-            # Special handling for course 8250 variants
-            if cn in ['8250']:
-                # For 8250 variants, only need C or better in one semester
-                c_or_better_grades = []
-                for sem_data in semester_data:
-                    grade = sem_data['grade'].upper().strip() if sem_data['grade'] else ''
-                    if grade.startswith('A') or grade.startswith('B') or grade.startswith('C'):
-                        c_or_better_grades.append(sem_data)
-                
-                passed_8250 = len(c_or_better_grades) >= 1
-                course_status[cn] = {
-                    'passed': passed_8250,
-                    'semesters': semester_data,
-                    'is_year_long': True
-                }
-                
-                core.log(f"8250 variant course {cn}: {'PASSED' if passed_8250 else 'FAILED'} - needs C or better in one semester")
-                
-            else:
-                # Regular year-long courses: pass if second semester is passed
-                # Find semester 1 and 2 data
-                sem1_data = next((sem for sem in semester_data if sem['semester'] == 1), None)
-                sem2_data = next((sem for sem in semester_data if sem['semester'] == 2), None)
-                
-                # Course passes if second semester is passed
-                if sem2_data and sem2_data['passed']:
-                    course_passed = True
-                    if sem1_data and not sem1_data['passed']:
-                        core.log(f"Year-long course {cn}: PASSED - failed first semester but passed second semester")
-                    else:
-                        core.log(f"Year-long course {cn}: PASSED - passed second semester")
-                else:
-                    course_passed = False
-                    core.log(f"Year-long course {cn}: FAILED - did not pass second semester")
-                
-                course_status[cn] = {
-                    'passed': course_passed,
-                    'semesters': semester_data,
-                    'is_year_long': True
-                }
-            
+    def apply_stage() -> int:
+        with cnxn.begin() as conn:
+            conn.execute(text(get_sql().create_his_dual_credit_stage.format(**names)))
+            insert_stage = text(get_sql().insert_his_dual_credit_stage.format(**names))
+            for batch in chunked(staged, max(int(batch_size), 1)):
+                conn.execute(insert_stage, batch)
+            result = conn.execute(text(get_sql().apply_his_dual_credit_stage.format(**names)))
+            conn.execute(text(get_sql().drop_his_dual_credit_stage.format(**names)))
+            return result.rowcount
+    
+    start = time.perf_counter()
+    try:
+        # The whole transaction is rerun after a deadlock or lock timeout
+        rowcount = run_with_retries(apply_stage, report, label=report['label'])
+        if rowcount is not None and rowcount >= 0:
+            report['rows_affected'] = rowcount
         else:
-            # Single semester course
-            row = course_group.iloc[0]  
-            grade = row.get('MK', '')
-            passed = is_passing_grade(grade)
-            
-            course_status[cn] = {
-                'passed': passed,
-                'semesters': [{'semester': row.get('TE', ''), 'term': row.get('TE', ''), 'grade': grade, 'passed': passed}],
-                'is_year_long': False
-            }
-            
-            core.log(f"Single semester course {cn}: {'PASSED' if passed else 'FAILED'}")
+            report['rows_unreported'] = len(staged)
+        report['batches'] = report['committed_batches'] = 1
+    except Exception as e:
+        log.error("Error applying staged HIS updates, transaction rolled back: %s", e)
+        raise
+    finally:
+        record_batch(time.perf_counter() - start)
+    log.info("Applied %d staged HIS updates, %d rows affected", report['rows'], report['rows_affected'])
+    return report
+
+def apply_his_updates(pass_updates: list[dict], fail_updates: list[dict], apply_mode: str = HIS_APPLY_MODE, batch_size: int = HIS_WRITE_BATCH_SIZE, cnxn=None) -> dict:
+    """Write pass/fail HIS updates with the chosen apply mode and return one combined report."""
+    log.info("Applying %d pass and %d fail HIS updates (%s mode)", len(pass_updates), len(fail_updates), apply_mode)
+    with timed('write'):
+        if apply_mode == 'staged':
+            return apply_his_updates_staged(pass_updates, fail_updates, batch_size, cnxn=cnxn)
+        reports = flush_his_updates(pass_updates, fail_updates, batch_size, cnxn=cnxn)
+        return combine_reports(list(reports.values()), label='HIS updates')
+
+def count_outcomes(evaluated: DataFrame) -> dict:
+    """
+    Count evaluated rows by outcome for the end-of-run summary.
+
+    Returns:
+        dict: {'passed year-long': int, 'passed semester': int, 'failed year-long': int, 'failed semester': int, 'unmapped': int}
+    """
+    mapped = evaluated['CREDIT_HOURS'].notna()
+    passed = evaluated['PASSED'].astype(bool)
+    year_long = evaluated['IS_YEAR_LONG'].astype(bool)
+    return {
+        'passed year-long': int((mapped & passed & year_long).sum()),
+        'passed semester': int((mapped & passed & ~year_long).sum()),
+        'failed year-long': int((mapped & ~passed & year_long).sum()),
+        'failed semester': int((mapped & ~passed & ~year_long).sum()),
+        'unmapped': int((~mapped).sum()),
+    }
+
+def log_student_detail(evaluated: DataFrame) -> None:
+    """Log how every course of every student was evaluated, at DEBUG."""
+    for pid, student_years in iter_student_years(evaluated):
+        log.debug("Processing student PID %s with %d years of data", pid, len(student_years))
+        for year, year_courses in student_years:
+            log.debug("Processing PID: %s, Year: %s with %d courses", pid, year, len(year_courses))
+            for row in year_courses.itertuples(index=False):
+                kind = 'Year-long' if row.IS_YEAR_LONG else 'Single semester'
+                if isna(row.CREDIT_HOURS):
+                    log.debug("Course CN %s not found in translation dictionary. Skipping for PID %s.", row.CN, pid)
+                elif row.PASSED:
+                    log.debug("%s course %s passed - queuing update with %s credit hours", kind, row.CN, row.CREDIT_HOURS)
+                else:
+                    log.debug("%s course %s not passed - queuing SDE/ST only update for PID %s", kind, row.CN, pid)
+
+def evaluate_dual_credit_chunk(data: DataFrame, course_terms: dict, location_st: dict, diff_only: bool = HIS_DIFF_ONLY) -> tuple[list[dict], list[dict], dict]:
+    """
+    Evaluate a frame of complete students and build its HIS updates.
+    
+    Returns:
+        tuple: (pass_updates, fail_updates, counts) as returned by build_his_updates
+    """
+    with timed('evaluate'):
+        evaluated = evaluate_dual_credit_courses(sort_dual_credit_rows(data), course_terms)
+        add_outcomes(count_outcomes(evaluated))
+        # Per-row detail is only walked when DEBUG logging is on
+        if log.isEnabledFor(logging.DEBUG):
+            log_student_detail(evaluated)
+        return build_his_updates(evaluated, location_st, diff_only=diff_only)
+
+def add_counts(total: dict, counts: dict) -> dict:
+    """Add one chunk's row counts into the running totals."""
+    for key, value in counts.items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+def partition_students(data: DataFrame, partitions: int) -> list[DataFrame]:
+    """Split a frame of complete students into up to `partitions` frames by PID."""
+    if partitions <= 1:
+        return [data]
+    return [students for _, students in data.groupby(data['PID'] % partitions, sort=False)]
+
+def process_students(data: DataFrame, course_terms: dict, location_st: dict, diff_only: bool = HIS_DIFF_ONLY, apply_mode: str = HIS_APPLY_MODE, batch_size: int = HIS_WRITE_BATCH_SIZE, cnxn=None) -> dict:
+    """
+    Evaluate and write one frame of complete students.
     
-    return course_status
+    Returns:
+        dict: {'students', 'counts', 'writes'}
+    """
+    pass_updates, fail_updates, counts = evaluate_dual_credit_chunk(data, course_terms, location_st, diff_only)
+    writes = apply_his_updates(pass_updates, fail_updates, apply_mode, batch_size, cnxn=cnxn)
+    return {'students': int(data['PID'].nunique()), 'counts': counts, 'writes': writes}
 
+@track_run('update-hist')
 @decorators.log_function_timer
-def update_dual_credit_hist() -> None:
-    """Main function to update dual credit history records."""
-    data = read_sql_query(SQL.dual_credit_courses, CNXN)
-    if data.empty: 
-        core.log("No dual credit courses found to update.")
-        return
-    course_terms = get_course_terms()  
-    # Process each student individually
-    student_ids = data['PID'].unique()
-   
-    for pid in student_ids:
-        core.log(f" Processing student PID: {pid} ".center(80, '#'))
-        student_data = data[data['PID'] == pid].sort_values(by=['YR', 'TE'], ascending=[False, True])
-        years = student_data['YR'].unique()
+def update_dual_credit_hist(batch_size: int = HIS_WRITE_BATCH_SIZE, apply_mode: str = HIS_APPLY_MODE, diff_only: bool = HIS_DIFF_ONLY, pids: list[int] = None, years: list[int] = None, courses: list[str] = None, chunk_size: int = DUAL_CREDIT_CHUNK_SIZE, workers: int = DUAL_CREDIT_WORKERS, pipeline: bool = DUAL_CREDIT_PIPELINE, since_year: int = None, schools: list[int] = None, resume: bool = False) -> dict:
+    """
+    Main function to update dual credit history records.
+    
+    The dual credit query is streamed in PID order, about `chunk_size` rows at a time, and
+    each frame of complete students is evaluated and written before the next one is read.
+    With more than one worker, each frame is split by PID across a thread pool that writes
+    through an engine whose pool has a connection per worker (plus one for the read).
+    With `pipeline`, reading, rule evaluation and writing run as separate stages connected
+    by bounded queues, so the next frame is read and evaluated while the last one is written.
+    
+    Students whose writes all committed are recorded in a checkpoint file after every frame.
+    With `resume`, students completed by an earlier run with the same filters are skipped;
+    the checkpoint is deleted once a run finishes without failures.
+    
+    Args:
+        batch_size: Rows per write batch
+        apply_mode: 'batch' for executemany UPDATE batches, 'staged' for a staging table
+                    applied with one set-based UPDATE
+        diff_only: Skip rows whose SDE/ST/CH already match the computed target
+        pids: Only update these students
+        years: Only update these school years
+        courses: Only update these courses (defaults to every mapped course)
+        chunk_size: Rows read per chunk; 0 reads the whole query at once
+        workers: Worker threads; 1 processes students serially
+        pipeline: Overlap the read, evaluate and write stages (requires workers=1)
+        since_year: Only update school years from this one on
+        schools: Only update records from these HIS school codes (SCH)
+        resume: Skip students completed by the last unfinished run with the same filters
         
-        core.log(f"Student# {pid} with {len(years)} years of data")
+    Returns:
+        dict: {'students', 'counts', 'writes', 'errors'} where counts holds unmapped/unchanged/changed
+              row counts, writes is the combined write report and errors lists failed partitions.
+              Pipeline runs also return per-stage throughput 'stages'.
+    """
+    if apply_mode not in HIS_APPLY_MODES:
+        raise ValueError(f"Unknown apply mode: {apply_mode}. Expected one of {HIS_APPLY_MODES}")
+    workers = max(int(workers), 1)
+    if pipeline and workers > 1:
+        raise ValueError("Pipeline mode runs one evaluator and one writer; use workers=1 with pipeline=True")
+    cnxn = ensure_pool_size(workers + 1) if workers > 1 else get_cnxn()
+    scope = {'pids': pids, 'years': years, 'courses': courses, 'since_year': since_year, 'schools': schools}
+    checkpoint = open_checkpoint('update-hist', get_database(), scope, resume=resume)
+    completed_pids = list(checkpoint['completed_pids'])
+    catalog = load_catalog()
+    course_terms = get_course_terms(catalog)
+    location_st = {cn: check_offered_at_location(cn, catalog) for cn in get_all_courses()}
+    
+    if chunk_size:
+        student_chunks = stream_dual_credit_courses(cnxn, get_sql().dual_credit_courses, chunk_size, courses=courses, pids=pids, years=years, since_year=since_year, schools=schools)
+    else:
+        with timed('read'):
+            student_chunks = [read_dual_credit_courses(cnxn, get_sql().dual_credit_courses, courses=courses, pids=pids, years=years, since_year=since_year, schools=schools)]
+    student_chunks = timed_iter(student_chunks, 'read')
+    if completed_pids:
+        student_chunks = (data[~data['PID'].isin(completed_pids)] for data in student_chunks)
+    partitions = (
+        partition
+        for data in student_chunks if not data.empty
+        for partition in partition_students(data, workers)
+    )
+    
+    # The adaptive batch size tuned by one frame's writes is where the next frame starts
+    tuning = {'batch_size': batch_size}
+    
+    def process(data: DataFrame) -> dict:
+        log.info("Processing %d HIS rows for %d students", len(data), data['PID'].nunique())
+        result = process_students(data, course_terms, location_st, diff_only, apply_mode, tuning['batch_size'], cnxn=cnxn)
+        tuning['batch_size'] = result['writes'].get('batch_size', tuning['batch_size'])
+        record_progress(checkpoint, result['writes'], pids=data['PID'].unique())
+        return result
+    
+    def evaluate(data: DataFrame) -> dict:
+        pass_updates, fail_updates, counts = evaluate_dual_credit_chunk(data, course_terms, location_st, diff_only)
+        return {
+            'students': int(data['PID'].nunique()),
+            'pids': data['PID'].unique(),
+            'rows': len(pass_updates) + len(fail_updates),
+            'counts': counts,
+            'pass_updates': pass_updates,
+            'fail_updates': fail_updates,
+        }
+    
+    def write(evaluated: dict) -> dict:
+        writes = apply_his_updates(evaluated['pass_updates'], evaluated['fail_updates'], apply_mode, tuning['batch_size'], cnxn=cnxn)
+        tuning['batch_size'] = writes.get('batch_size', tuning['batch_size'])
+        record_progress(checkpoint, writes, pids=evaluated['pids'])
+        return {'students': evaluated['students'], 'rows': writes['rows'], 'counts': evaluated['counts'], 'writes': writes}
+    
+    stages = None
+    if pipeline:
+        log.info("Processing students as a read/evaluate/write pipeline (queue size %d)", PIPELINE_QUEUE_SIZE)
+        results, stages = run_pipeline(partitions, [('evaluate', evaluate), ('write', write)], PIPELINE_QUEUE_SIZE)
+        errors = []
+    elif workers > 1:
+        log.info("Processing students with %d workers", workers)
+        results, errors = run_in_pool(process, partitions, workers, label='student partition')
+    else:
+        results, errors = [process(data) for data in partitions], []
+    
+    if not results and not errors:
+        finish_checkpoint(checkpoint, complete=True)
+        log.info("No dual credit courses found to update.")
+        return {}
+    counts: dict = {}
+    for result in results:
+        add_counts(counts, result['counts'])
+    writes = combine_reports([result['writes'] for result in results], label='HIS updates')
+    finish_checkpoint(checkpoint, complete=not errors and not writes['failed_batches'])
+    add_rows('read', sum(counts.values()))
+    # Rows the driver could not count (rowcount -1) were still committed
+    add_rows('updated', writes['rows_affected'] + writes['rows_unreported'])
+    add_rows('skipped', counts.get('unchanged', 0) + counts.get('unmapped', 0))
+    add_rows('failed', len(writes['failed_rows']))
+    summary = {'students': sum(result['students'] for result in results), 'counts': counts, 'writes': writes, 'errors': errors}
+    log.info(
+        "Processed %d students: %d HIS rows changed, %d already up to date, %d unmapped",
+        summary['students'], counts.get('changed', 0), counts.get('unchanged', 0), counts.get('unmapped', 0)
+    )
+    log_batch_report(writes)
+    if stages:
+        summary['stages'] = stages
+        log_pipeline_stats(stages)
+    if errors:
+        log.error("%d student partitions failed: %s", len(errors), errors)
+    return summary
+
+def load_course_rows(courses: list[str], pids: list[int] = None, years: list[int] = None, since_year: int = None, schools: list[int] = None, use_snapshot: bool = False, refresh_snapshot: bool = False) -> DataFrame:
+    """
+    Return dual credit HIS rows for some courses, from the local snapshot when possible.
+    
+    The snapshot only holds mapped courses and has no school column, so requests for other
+    courses or filtered by school always run the query.
+    """
+    courses = [str(course) for course in courses]
+    if use_snapshot and not schools and set(courses) <= set(get_all_courses()):
+        path = get_snapshot(get_cnxn(), get_sql().dual_credit_courses, get_database(), refresh=refresh_snapshot)
+        return read_snapshot(path, courses=courses, pids=pids, years=years, since_year=since_year)
+    return read_dual_credit_courses(get_cnxn(), get_sql().dual_credit_courses, courses=courses, pids=pids, years=years, since_year=since_year, schools=schools)
+
+def find_course(course: str, pids: list[int] = None, years: list[int] = None, since_year: int = None, schools: list[int] = None, path: str = None, use_snapshot: bool = False) -> int:
+    """
+    Export data for a specific course to CSV for analysis.
+    
+    Args:
+        course: Course number to export
+        pids, years, since_year, schools: Optional filters, as in update_dual_credit_hist
+        path: Output CSV (defaults to <course>.csv)
+        use_snapshot: Read from the local Parquet snapshot instead of querying the database
         
-        for year in years:
-            core.log(f" Processing year: {year} ".center(70, '*').center(80, ' '))
-            courses = student_data[student_data['YR'] == year]
-            core.log(f"Processing PID: {pid}, Year: {year} with {len(courses)} courses")
-            
-            course_status = check_year_long_pass(courses, course_terms)
-            
-            # Update records for all courses (passed courses get credit hours, failed courses get SDE/ST only)
-            for index, row in courses.iterrows():
-                core.log(f" Processing course CN: {row['CN']} ".center(55, '-').center(80, ' '))
-                cn = str(row['CN'])  
-                sq = str(row['SQ'])  
-                pid_int = int(row['PID'])  
-                credit_hours = get_course_hours(cn)
-                location_code_st = check_offered_at_location(cn)
-                
-                if credit_hours is None:
-                    core.log(f"Course CN {cn} not found in translation dictionary. Skipping for PID {pid_int}.")
-                    continue
-                
-                # Check if this course was passed
-                if cn in course_status:
-                    if course_status[cn]['passed']:
-                        core.log(f"Course {cn} passed - updating record with credit hours")
-                        if course_status[cn]['is_year_long']:
-                            # For year-long courses, split credit hours between semesters
-                            credit_hours = credit_hours / 2 if credit_hours else 0
+    Returns:
+        int: Number of exported records
+    """
+    path = path or f'{course}.csv'
+    course_data = load_course_rows([course], pids, years, since_year, schools, use_snapshot)
+    course_data.to_csv(path, index=False)
+    log.info("Exported %d records for course %s to %s", len(course_data), course, path)
+    return len(course_data)
 
-                        update_his_record(pid_int, cn, sq, credit_hours, st=location_code_st)
-                    else:
-                        core.log(f"Course {cn} not passed - updating SDE/ST only for PID {pid_int}")
-                        
-                        update_his_record_sde_st_only(pid_int, cn, sq, st=location_code_st)
-                else:
-                    core.log(f"Course {cn} status unknown - updating SDE/ST only for PID {pid_int}")
-                    update_his_record_sde_st_only(pid_int, cn, sq, st=location_code_st)
+def export_courses(courses: list[str], output_dir: str = '.', pids: list[int] = None, years: list[int] = None, since_year: int = None, schools: list[int] = None, use_snapshot: bool = False, refresh_snapshot: bool = False) -> dict:
+    """
+    Export several courses with one read, writing <output_dir>/<course>.csv for each.
+    
+    Returns:
+        dict: Exported record count per course
+    """
+    courses = [str(course) for course in courses]
+    data = load_course_rows(courses, pids, years, since_year, schools, use_snapshot, refresh_snapshot)
+    os.makedirs(output_dir, exist_ok=True)
+    exported = {}
+    for course in courses:
+        course_data = data[data['CN'].astype(str) == course]
+        path = os.path.join(output_dir, f'{course}.csv')
+        course_data.to_csv(path, index=False)
+        exported[course] = len(course_data)
+        log.info("Exported %d records for course %s to %s", len(course_data), course, path)
+    return exported
 
-def find_course(course: str) -> None:
-    """Export data for a specific course to CSV for analysis."""
-    data = read_sql_query(SQL.dual_credit_courses, CNXN)
-    course_data = data[data['CN'] == course]
-    course_data.to_csv(f'{course}.csv', index=False)
-    core.log(f"Exported {len(course_data)} records for course {course} to {course}.csv")
+def load_catalog() -> dict:
+    """Return the shared CRS snapshot covering every mapped course."""
+    return get_course_catalog(get_cnxn(), get_sql().course_catalog, get_all_courses())
 
-def get_course_terms() -> dict:
-    courses = f"'{"', '".join(list(COURSE_HOURS_MAPPING.keys()))}'"
-    course_terms = read_sql_query(f"""
-    select distinct cn, tm
-    from crs
-    where cn in ({courses})
-    """, CNXN)
-    return course_terms.set_index('cn')['tm'].to_dict()
+def get_course_terms(catalog: dict = None) -> dict:
+    """Return a dictionary mapping mapped course numbers to their CRS term types."""
+    catalog = catalog if catalog is not None else load_catalog()
+    return {cn: get_course_term(catalog, cn) for cn in get_all_courses() if cn in catalog}
 
-def check_offered_at_location(cn: str) -> int:
-    
+def check_offered_at_location(cn: str, catalog: dict = None) -> int:
+    """Return the ST code for a course from its CRS department (ROP for 'R', otherwise the default school)."""
     try:
-        with CNXN.connect() as conn:
-            result = conn.execute(text(SQL.check_offered_at_location), {"cn": cn})
-            row = result.fetchone()
-            department_code = row[0] if row else None
-            
-            if department_code is None:
-                core.log(f"No location code found for course {cn}. Defaulting to {DEFAULT_SCHOOL_ST}.")
-                return DEFAULT_SCHOOL_ST
-            if department_code == 'R':
-                return ROP_LOCATION_CODE_ST
-            else:
-                return DEFAULT_SCHOOL_ST
+        catalog = catalog if catalog is not None else get_course_catalog(get_cnxn(), get_sql().course_catalog, [cn])
+        return get_location_st(catalog, cn, DEFAULT_SCHOOL_ST, ROP_LOCATION_CODE_ST)
     except Exception as e:
-        core.log(f"Error checking offered at location for course {cn}: {e}")
+        log.error("Error checking offered at location for course %s: %s", cn, e)
         return None
    
 
@@ -257,10 +433,13 @@ def check_offered_at_location(cn: str) -> int:
 if __name__ == "__main__":
     core.log("$"*80)
     core.log(f"Starting update_dual_credit_hist")
-    update_dual_credit_hist()
+    summary = update_dual_credit_hist()
     core.log("$"*80)
     core.log(f"Starting update_articulated_courses")
     update_articulated_courses()
     core.log("$"*80)
+    # Failed write batches and partitions are reported rather than raised; fail the run like cli.py does
+    if summary.get('errors') or summary.get('writes', {}).get('failed_batches'):
+        sys.exit(1)
     # check = check_offered_at_location('75341')
     # print(check)
\ No newline at end of file
@@ -0,0 +1,257 @@
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+import numpy as np
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from db import get_database
+from logs import flush_logs, get_logger, setup_logging
+
+METRICS_DIR = config('METRICS_DIR', default='metrics', cast=str)
+BATCH_PERCENTILES = (50, 90, 99)
+PROMETHEUS_PREFIX = 'dual_credit'
+
+_LOCK = threading.Lock()
+# Context variables, so concurrent runs on different databases keep separate metrics
+_RUN: ContextVar[dict] = ContextVar('metrics_run', default=None)
+_LAST_REPORT: ContextVar[dict] = ContextVar('metrics_last_report', default=None)
+
+log = get_logger('metrics')
+
+
+def new_run(job: str, database: str) -> dict:
+    return {
+        'job': job,
+        'database': database,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'start_time': time.perf_counter(),
+        'round_trips': 0,
+        'sql_seconds': 0.0,
+        'rows': {},
+        'outcomes': {},
+        'phases': {},
+        'batch_seconds': [],
+    }
+
+
+def current_run() -> dict:
+    """Return the metrics of the run in progress, or None outside a tracked run."""
+    return _RUN.get()
+
+
+def last_report() -> dict:
+    """Return the report of the last finished run, or None before the first one."""
+    return _LAST_REPORT.get()
+
+
+def add_rows(kind: str, count: int) -> None:
+    """Add to a row counter (read, updated, inserted, skipped, ...) of the current run."""
+    run = _RUN.get()
+    if run is None or not count:
+        return
+    with _LOCK:
+        run['rows'][kind] = run['rows'].get(kind, 0) + int(count)
+
+
+def add_outcomes(counts: dict) -> None:
+    """Add per-outcome counts (passed, failed, rejected for a reason, ...) for the end-of-run summary."""
+    run = _RUN.get()
+    if run is None:
+        return
+    with _LOCK:
+        for outcome, count in counts.items():
+            if count:
+                run['outcomes'][outcome] = run['outcomes'].get(outcome, 0) + int(count)
+
+
+def add_phase_time(phase: str, seconds: float) -> None:
+    run = _RUN.get()
+    if run is None:
+        return
+    with _LOCK:
+        run['phases'][phase] = run['phases'].get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str):
+    """Add the time spent in the block to a phase (read, evaluate, write) of the current run."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase_time(phase, time.perf_counter() - start)
+
+
+def timed_iter(items, phase: str):
+    """Yield from `items`, counting the time spent producing each item towards `phase`."""
+    iterator = iter(items)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            add_phase_time(phase, time.perf_counter() - start)
+            return
+        add_phase_time(phase, time.perf_counter() - start)
+        yield item
+
+
+def record_batch(seconds: float) -> None:
+    """Record the latency of one committed or failed write batch."""
+    run = _RUN.get()
+    if run is None:
+        return
+    with _LOCK:
+        run['batch_seconds'].append(seconds)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_start')
+    elapsed = time.perf_counter() - started.pop() if started else 0.0
+    run = _RUN.get()
+    if run is None:
+        return
+    with _LOCK:
+        # An executemany batch is sent as one call, so it counts as one round trip
+        run['round_trips'] += 1
+        run['sql_seconds'] += elapsed
+
+
+def percentile_summary(values: list[float]) -> dict:
+    if not values:
+        return {'count': 0}
+    summary = {'count': len(values), 'mean': float(np.mean(values)), 'max': float(np.max(values))}
+    for percentile in BATCH_PERCENTILES:
+        summary[f'p{percentile}'] = float(np.percentile(values, percentile))
+    return summary
+
+
+def build_report(run: dict, status: str) -> dict:
+    """Turn the raw run counters into the exported report."""
+    return {
+        'job': run['job'],
+        'database': run['database'],
+        'started': run['started'],
+        'status': status,
+        'duration_seconds': round(time.perf_counter() - run['start_time'], 3),
+        'round_trips': run['round_trips'],
+        'sql_seconds': round(run['sql_seconds'], 3),
+        'rows': dict(run['rows']),
+        'outcomes': dict(run['outcomes']),
+        'phases': {phase: round(seconds, 3) for phase, seconds in run['phases'].items()},
+        'batch_seconds': percentile_summary(run['batch_seconds']),
+    }
+
+
+def prometheus_lines(report: dict) -> list[str]:
+    """Render a report in the Prometheus text exposition format (for the node exporter textfile collector)."""
+    labels = f'job="{report["job"]}",database="{report["database"]}"'
+    lines = []
+
+    def metric(name: str, help_text: str, samples: list[tuple[str, float]]) -> None:
+        lines.append(f'# HELP {PROMETHEUS_PREFIX}_{name} {help_text}')
+        lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} gauge')
+        for extra, value in samples:
+            lines.append(f'{PROMETHEUS_PREFIX}_{name}{{{labels}{extra}}} {value}')
+
+    metric('run_success', 'Whether the last run finished without an exception', [('', int(report['status'] == 'success'))])
+    metric('run_timestamp_seconds', 'Unix time the last run finished', [('', int(time.time()))])
+    metric('run_duration_seconds', 'Wall-clock duration of the last run', [('', report['duration_seconds'])])
+    metric('sql_round_trips', 'SQL statements sent to the database', [('', report['round_trips'])])
+    metric('sql_seconds', 'Time spent waiting on SQL statements', [('', report['sql_seconds'])])
+    metric('rows', 'Rows read, updated, inserted or skipped', [(f',kind="{kind}"', count) for kind, count in report['rows'].items()])
+    metric('outcomes', 'Rows per evaluation outcome', [(f',outcome="{outcome}"', count) for outcome, count in report['outcomes'].items()])
+    metric('phase_seconds', 'Time spent per phase, summed across workers', [(f',phase="{phase}"', seconds) for phase, seconds in report['phases'].items()])
+    batches = report['batch_seconds']
+    metric('batch_seconds', 'Write batch latency', [
+        (f',quantile="{int(key[1:]) / 100}"' if key.startswith('p') else f',stat="{key}"', value)
+        for key, value in batches.items() if key != 'count'
+    ])
+    metric('batches', 'Write batches sent', [('', batches['count'])])
+    return lines
+
+
+def write_atomic(path: str, content: str) -> None:
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def write_report(report: dict, directory: str = METRICS_DIR) -> str:
+    """Write the report as <job>_<database>.json and .prom files and return the JSON path."""
+    base = os.path.join(directory, f"{report['job']}_{report['database']}")
+    write_atomic(f'{base}.json', json.dumps(report, indent=2))
+    write_atomic(f'{base}.prom', '\n'.join(prometheus_lines(report)) + '\n')
+    return f'{base}.json'
+
+
+def log_report(report: dict) -> None:
+    log.info(
+        "Run metrics for %s: %ss, %d SQL round trips (%ss), rows %s, phases %s",
+        report['job'], report['duration_seconds'], report['round_trips'], report['sql_seconds'], report['rows'], report['phases']
+    )
+    if report['outcomes']:
+        log.info("Outcomes: %s", ', '.join(f'{outcome} {count}' for outcome, count in sorted(report['outcomes'].items())))
+    batches = report['batch_seconds']
+    if batches['count']:
+        log.info(
+            "Write batches: %d, p50 %.3fs, p90 %.3fs, p99 %.3fs, max %.3fs",
+            batches['count'], batches['p50'], batches['p90'], batches['p99'], batches['max']
+        )
+
+
+def track_run(job: str):
+    """
+    Decorator collecting run metrics for an entry point and exporting them when it returns.
+
+    A tracked function called while another run is in progress in the same context adds to
+    that run instead of starting its own; runs on other threads (see multi_database) keep
+    their own metrics. The report is written even when the run raises. Logging is set up when
+    a run starts and flushed when it ends, after the summary.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _RUN.get() is not None:
+                return func(*args, **kwargs)
+            setup_logging()
+            token = _RUN.set(new_run(job, get_database()))
+            status = 'failed'
+            try:
+                result = func(*args, **kwargs)
+                status = 'success'
+                return result
+            finally:
+                run = _RUN.get()
+                _RUN.reset(token)
+                report = build_report(run, status)
+                _LAST_REPORT.set(report)
+                log_report(report)
+                try:
+                    log.info("Run metrics written to %s", write_report(report))
+                except OSError as e:
+                    log.error("Could not write run metrics: %s", e)
+                flush_logs()
+        return wrapper
+    return decorate
@@ -0,0 +1,119 @@
+import json
+import os
+import time
+from datetime import datetime
+from decouple import Csv, config
+from db import use_database
+from logs import get_logger
+from metrics import METRICS_DIR, last_report, write_atomic
+from parallel import run_in_pool
+
+DATABASES = config('DATABASES', default='', cast=Csv())
+DATABASE_CONCURRENCY = config('DATABASE_CONCURRENCY', default=2, cast=int)
+
+log = get_logger('multi_database')
+
+
+def run_for_database(database: str, func) -> dict:
+    """
+    Call `func()` with `database` selected and return its result and run report.
+
+    Returns:
+        dict: {'database', 'status', 'result', 'error', 'report', 'seconds'}
+    """
+    outcome = {'database': database, 'status': 'failed', 'result': None, 'error': None, 'report': None}
+    # The worker's context starts as a copy of the caller's, so only a new report belongs to this run
+    previous_report = last_report()
+    start = time.perf_counter()
+    try:
+        with use_database(database):
+            outcome['result'] = func()
+        outcome['status'] = 'success'
+    except Exception as e:
+        log.error("Run on %s failed: %s", database, e)
+        outcome['error'] = str(e)
+    report = last_report()
+    outcome['report'] = report if report is not previous_report else None
+    outcome['seconds'] = round(time.perf_counter() - start, 3)
+    return outcome
+
+
+def consolidate_reports(outcomes: list[dict], seconds: float) -> dict:
+    """
+    Combine the per-database outcomes of run_databases into one report.
+
+    Rows and outcome counts are summed across databases; each database keeps its own status,
+    duration and row counts under 'databases'.
+    """
+    consolidated = {
+        'job': next((outcome['report']['job'] for outcome in outcomes if outcome['report']), None),
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'status': 'success' if all(outcome['status'] == 'success' for outcome in outcomes) else 'failed',
+        'duration_seconds': round(seconds, 3),
+        'rows': {},
+        'outcomes': {},
+        'databases': {},
+    }
+    for outcome in sorted(outcomes, key=lambda outcome: outcome['database']):
+        report = outcome['report'] or {}
+        for key in ('rows', 'outcomes'):
+            for kind, count in report.get(key, {}).items():
+                consolidated[key][kind] = consolidated[key].get(kind, 0) + count
+        consolidated['databases'][outcome['database']] = {
+            'status': outcome['status'],
+            'duration_seconds': outcome['seconds'],
+            'round_trips': report.get('round_trips', 0),
+            'rows': report.get('rows', {}),
+            'error': outcome['error'],
+        }
+    if consolidated['databases']:
+        consolidated['slowest_database'] = max(consolidated['databases'], key=lambda db: consolidated['databases'][db]['duration_seconds'])
+    return consolidated
+
+
+def log_consolidated_report(report: dict) -> None:
+    log.info("%s on %d databases: %s in %ss, rows %s", report['job'], len(report['databases']), report['status'], report['duration_seconds'], report['rows'])
+    for database, summary in report['databases'].items():
+        log.info(
+            "  %s: %s in %ss, %d SQL round trips, rows %s%s", database, summary['status'], summary['duration_seconds'],
+            summary['round_trips'], summary['rows'], f", error: {summary['error']}" if summary['error'] else ''
+        )
+
+
+def run_databases(databases: list[str], func, concurrency: int = DATABASE_CONCURRENCY) -> dict:
+    """
+    Run an entry point on several year databases at once.
+
+    `func` is called once per database on its own thread with the database selected by
+    db.use_database, so it gets that database's engine, CRS catalog, checkpoint, snapshot and
+    run metrics. At most `concurrency` databases run at a time; workers started inside a run
+    (DUAL_CREDIT_WORKERS) come on top of that. A failing database is reported without
+    stopping the others. A single database runs on the calling thread.
+
+    Args:
+        databases: Database names, e.g. ['DST23000SLUSD', 'DST24000SLUSD']
+        func: Zero-argument callable running one entry point
+        concurrency: Maximum number of databases processed at the same time
+
+    Returns:
+        dict: Consolidated report (see consolidate_reports) plus 'results' by database
+    """
+    databases = list(dict.fromkeys(databases))
+    log.info("Running on %d databases, %d at a time: %s", len(databases), concurrency, ', '.join(databases))
+    start = time.perf_counter()
+    if len(databases) == 1:
+        # One database runs on the calling thread, where --profile-functions can see it
+        outcomes = [run_for_database(databases[0], func)]
+    else:
+        outcomes, _ = run_in_pool(lambda database: run_for_database(database, func), databases, min(max(int(concurrency), 1), len(databases)), label='database')
+    report = consolidate_reports(outcomes, time.perf_counter() - start)
+    log_consolidated_report(report)
+    if report['job']:
+        try:
+            path = os.path.join(METRICS_DIR, f"{report['job']}_all_databases.json")
+            write_atomic(path, json.dumps(report, indent=2))
+            log.info("Consolidated run metrics written to %s", path)
+        except OSError as e:
+            log.error("Could not write consolidated run metrics: %s", e)
+    report['results'] = {outcome['database']: outcome['result'] for outcome in outcomes}
+    return report
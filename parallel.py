@@ -0,0 +1,50 @@
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logs import get_logger
+
+log = get_logger('parallel')
+
+
+def run_in_pool(func, items, workers: int, label: str = 'task', max_pending: int = None) -> tuple[list, list[dict]]:
+    """
+    Run `func` over `items` on a thread pool and collect results and errors.
+
+    At most `max_pending` tasks (default twice the worker count) are queued at a time, so
+    a lazily generated `items` iterable is consumed only as fast as the workers keep up.
+    A failing task is logged and recorded without stopping the others. Each task runs in a
+    copy of the caller's context, so workers see the current run and database.
+
+    Args:
+        func: Called with one item, returns that item's result
+        items: Iterable of work items
+        workers: Number of worker threads
+        label: Name used in log lines and error records
+        max_pending: Maximum number of submitted but unfinished tasks
+
+    Returns:
+        tuple: (results, errors) where errors are {'label', 'item', 'error'} dicts
+    """
+    workers = max(int(workers), 1)
+    max_pending = max_pending or workers * 2
+    results, errors = [], []
+    pending = {}
+
+    def collect(done) -> None:
+        for future in done:
+            item_number = pending.pop(future)
+            try:
+                results.append(future.result())
+            except Exception as e:
+                log.error("%s %d failed: %s", label, item_number, e)
+                errors.append({'label': label, 'item': item_number, 'error': str(e)})
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=label) as executor:
+        for item_number, item in enumerate(items, start=1):
+            if len(pending) >= max_pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[executor.submit(contextvars.copy_context().run, func, item)] = item_number
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+    return results, errors
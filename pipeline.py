@@ -0,0 +1,146 @@
+import contextvars
+import queue
+import threading
+import time
+from logs import get_logger
+
+_DONE = object()
+
+log = get_logger('pipeline')
+
+
+def new_stage_stats(name: str) -> dict:
+    return {'stage': name, 'items': 0, 'rows': 0, 'busy_seconds': 0.0, 'wait_seconds': 0.0}
+
+
+def item_rows(item) -> int:
+    """Rows carried by a pipeline item: its length, or its 'rows' entry for dict items."""
+    if isinstance(item, dict):
+        return int(item.get('rows', 0))
+    try:
+        return len(item)
+    except TypeError:
+        return 0
+
+
+def run_pipeline(source, stages: list[tuple], queue_size: int = 2) -> tuple[list, list[dict]]:
+    """
+    Run a producer/consumer pipeline: a reader thread drains `source`, and each stage runs
+    in its own thread, connected by bounded queues.
+
+    A full queue blocks the stage feeding it (backpressure), so at most `queue_size` items
+    wait between two stages while reading, evaluating and writing overlap in time. If any
+    stage raises, the pipeline stops and the error is re-raised in the caller.
+
+    Args:
+        source: Iterable of items (read in the 'read' stage)
+        stages: (name, func) pairs; each func takes the previous stage's item and returns the next
+        queue_size: Capacity of each queue between stages
+
+    Returns:
+        tuple: (results of the last stage, per-stage stats dicts with items, rows,
+                busy_seconds, wait_seconds and items_per_second)
+    """
+    queues = [queue.Queue(maxsize=max(int(queue_size), 1)) for _ in stages]
+    results_queue = queue.Queue()
+    stats = [new_stage_stats('read')] + [new_stage_stats(name) for name, _ in stages]
+    errors: list[BaseException] = []
+    stop = threading.Event()
+
+    def put(target: queue.Queue, item, stage_stats: dict) -> bool:
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                stage_stats['wait_seconds'] += time.perf_counter() - start
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(source_queue: queue.Queue, stage_stats: dict):
+        start = time.perf_counter()
+        while not stop.is_set():
+            try:
+                item = source_queue.get(timeout=0.1)
+                stage_stats['wait_seconds'] += time.perf_counter() - start
+                return item
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def read() -> None:
+        stage_stats = stats[0]
+        iterator = iter(source)
+        try:
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, _DONE)
+                stage_stats['busy_seconds'] += time.perf_counter() - start
+                if item is _DONE:
+                    break
+                stage_stats['items'] += 1
+                stage_stats['rows'] += item_rows(item)
+                if not put(queues[0], item, stage_stats):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(queues[0], _DONE, stage_stats)
+
+    def work(index: int, func) -> None:
+        stage_stats = stats[index + 1]
+        target = queues[index + 1] if index + 1 < len(stages) else results_queue
+        try:
+            while True:
+                item = get(queues[index], stage_stats)
+                if item is _DONE:
+                    break
+                start = time.perf_counter()
+                result = func(item)
+                stage_stats['busy_seconds'] += time.perf_counter() - start
+                stage_stats['items'] += 1
+                stage_stats['rows'] += item_rows(result)
+                if not put(target, result, stage_stats):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            put(target, _DONE, stage_stats)
+
+    # Each stage thread runs in a copy of the caller's context, so it sees the current run and database
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(read,), name='pipeline-read', daemon=True)]
+    threads += [
+        threading.Thread(target=contextvars.copy_context().run, args=(work, index, func), name=f'pipeline-{name}', daemon=True)
+        for index, (name, func) in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+    results = []
+    while True:
+        item = results_queue.get()
+        if item is _DONE:
+            break
+        results.append(item)
+    for stage_stats in stats:
+        busy = stage_stats['busy_seconds']
+        stage_stats['items_per_second'] = stage_stats['items'] / busy if busy else 0.0
+    return results, stats
+
+
+def log_pipeline_stats(stats: list[dict]) -> None:
+    """Log one line of throughput stats per pipeline stage."""
+    log.info(f"{'stage':<10} {'items':>7} {'rows':>10} {'busy (s)':>10} {'waiting (s)':>12} {'items/s':>9}")
+    for stage_stats in stats:
+        log.info(
+            f"{stage_stats['stage']:<10} {stage_stats['items']:>7} {stage_stats['rows']:>10} "
+            f"{stage_stats['busy_seconds']:>10.2f} {stage_stats['wait_seconds']:>12.2f} "
+            f"{stage_stats['items_per_second']:>9.1f}"
+        )
@@ -0,0 +1,176 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from decouple import config
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from db import get_sql
+from logs import get_logger
+
+PROFILE_DIR = config('PROFILE_DIR', default='profiles', cast=str)
+PROFILE_TOP = config('PROFILE_TOP', default=25, cast=int)
+
+PLACEHOLDER = re.compile(r'\{[^{}]*\}')
+
+log = get_logger('profiling')
+
+
+def normalize_sql(sql: str) -> str:
+    return ' '.join(sql.split()).lower()
+
+
+def template_pattern(sql: str) -> re.Pattern:
+    """
+    Turn a SQL template with str.format placeholders into a regex over the whole normalized
+    statement, with each {placeholder} matching any text (including none).
+    """
+    parts = [re.escape(part.strip()) for part in PLACEHOLDER.split(normalize_sql(sql))]
+    return re.compile(r'\s*.*?\s*'.join(parts))
+
+
+def sql_templates(sql_object=None) -> list[tuple[object, str, bool]]:
+    """
+    Return (normalized text or pattern, name, is_pattern) for every file in the SQL directory.
+
+    Templates with str.format placeholders ({filters}, {stage}, ...) are matched as a whole,
+    with the placeholders as wildcards (template_pattern); the others must match exactly.
+    """
+    sql_object = sql_object if sql_object is not None else get_sql()
+    templates = []
+    for name, sql in vars(sql_object).items():
+        if not isinstance(sql, str):
+            continue
+        if PLACEHOLDER.search(sql):
+            templates.append((template_pattern(sql), name, True))
+        else:
+            templates.append((normalize_sql(sql), name, False))
+    # Exact templates first, then the patterns with the most literal text
+    return sorted(
+        templates,
+        key=lambda template: (template[2], -len(template[0].pattern if template[2] else template[0])),
+    )
+
+
+def new_trace(templates: list) -> dict:
+    return {'templates': templates, 'names': {}, 'statements': {}, 'lock': threading.Lock()}
+
+
+def statement_name(trace: dict, context, statement: str) -> str:
+    """Name a statement after its SQL file, falling back to the start of the statement text."""
+    compiled = getattr(context, 'compiled', None)
+    source = getattr(getattr(compiled, 'statement', None), 'text', None) or statement
+    name = trace['names'].get(source)
+    if name is not None:
+        return name
+    normalized = normalize_sql(source)
+    name = next(
+        (
+            template_name for template, template_name, is_pattern in trace['templates']
+            if (template.fullmatch(normalized) if is_pattern else normalized == template)
+        ),
+        None,
+    )
+    if name is None:
+        name = f"inline: {normalized[:60]}"
+    trace['names'][source] = name
+    return name
+
+
+def parameter_counts(parameters, executemany: bool) -> tuple[int, int]:
+    """Return (parameter sets, bind parameters per set) for a cursor execute."""
+    if executemany:
+        sets = len(parameters)
+        first = parameters[0] if sets else ()
+    else:
+        sets, first = 1, parameters
+    return sets, len(first) if first is not None else 0
+
+
+def record_statement(trace: dict, name: str, seconds: float, sets: int, binds: int) -> None:
+    with trace['lock']:
+        stats = trace['statements'].setdefault(
+            name, {'statement': name, 'calls': 0, 'parameter_sets': 0, 'max_binds': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+        )
+        stats['calls'] += 1
+        stats['parameter_sets'] += sets
+        stats['max_binds'] = max(stats['max_binds'], binds)
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+
+
+def hot_statements(trace: dict) -> list[dict]:
+    """Aggregated statements, slowest total time first."""
+    return sorted(trace['statements'].values(), key=lambda stats: stats['seconds'], reverse=True)
+
+
+def log_hot_statements(statements: list[dict], top: int = PROFILE_TOP) -> None:
+    log.info(f"{'statement':<40} {'calls':>7} {'param sets':>10} {'binds':>6} {'total (s)':>10} {'mean (ms)':>10} {'max (ms)':>9}")
+    for stats in statements[:top]:
+        log.info(
+            f"{stats['statement'][:40]:<40} {stats['calls']:>7} {stats['parameter_sets']:>10} {stats['max_binds']:>6} "
+            f"{stats['seconds']:>10.3f} {stats['seconds'] / stats['calls'] * 1000:>10.2f} {stats['max_seconds'] * 1000:>9.2f}"
+        )
+
+
+@contextmanager
+def profile_run(label: str, functions: bool = False, directory: str = PROFILE_DIR, top: int = PROFILE_TOP):
+    """
+    Trace every SQL statement run inside the block, and optionally profile it with cProfile.
+
+    Statements are named after their SQL file and aggregated by calls, parameter sets,
+    bind parameters and duration. On exit the hot-statement table (and with `functions`, the
+    hottest functions by cumulative time) is logged and written to `directory`.
+
+    Args:
+        label: Name for the output files, e.g. the CLI subcommand
+        functions: Also run cProfile and dump <label>_<time>.prof
+        directory: Directory for the profile output
+        top: Rows shown in the logged tables
+
+    Yields:
+        dict: The live trace; its 'statements' fill in while the block runs
+    """
+    trace = new_trace(sql_templates())
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profile_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('profile_start')
+        seconds = time.perf_counter() - started.pop() if started else 0.0
+        sets, binds = parameter_counts(parameters, executemany)
+        record_statement(trace, statement_name(trace, context, statement), seconds, sets, binds)
+
+    event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    profiler = cProfile.Profile() if functions else None
+    if profiler:
+        profiler.enable()
+    try:
+        yield trace
+    finally:
+        if profiler:
+            profiler.disable()
+        event.remove(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', after_cursor_execute)
+
+        base = os.path.join(directory, f"{label}_{datetime.now():%Y%m%d_%H%M%S}")
+        os.makedirs(directory, exist_ok=True)
+        statements = hot_statements(trace)
+        log.info("SQL statements by total time (%s):", label)
+        log_hot_statements(statements, top)
+        with open(f'{base}_sql.json', 'w') as f:
+            json.dump(statements, f, indent=2)
+        if profiler:
+            profiler.dump_stats(f'{base}.prof')
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(top)
+            log.info("Hottest functions by cumulative time (%s):\n%s", label, output.getvalue())
+        log.info("Profile written to %s_sql.json%s", base, f" and {base}.prof" if profiler else '')
@@ -0,0 +1,129 @@
+import glob
+import os
+from datetime import datetime, timedelta
+from decouple import config
+from pandas import DataFrame
+from sqlalchemy.engine import Engine
+from logs import get_logger
+from dual_credit_query import DUAL_CREDIT_COLUMNS, compact_dual_credit_frame, stream_dual_credit_courses
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = pq = None
+
+SNAPSHOT_DIR = config('SNAPSHOT_DIR', default='snapshots', cast=str)
+SNAPSHOT_TTL_MINUTES = config('SNAPSHOT_TTL_MINUTES', default=1440, cast=int)
+SNAPSHOT_CHUNK_SIZE = config('SNAPSHOT_CHUNK_SIZE', default=100000, cast=int)
+SNAPSHOTS_KEPT = 2
+TIMESTAMP_FORMAT = '%Y%m%d%H%M%S'
+
+log = get_logger('snapshot')
+
+
+def require_pyarrow() -> None:
+    if pq is None:
+        raise ImportError("Dual credit snapshots need pyarrow: pip install pyarrow")
+
+
+def snapshot_schema():
+    """Arrow schema of a snapshot file; fixed so every streamed chunk writes the same row group layout."""
+    return pa.schema([
+        ('PID', pa.int32()),
+        ('CN', pa.string()),
+        ('SQ', pa.int32()),
+        ('YR', pa.int16()),
+        ('TE', pa.int16()),
+        ('MK', pa.string()),
+        ('SDE', pa.int16()),
+        ('ST', pa.int16()),
+        ('CH', pa.float32()),
+    ])
+
+
+def snapshot_path(database: str, taken: datetime, directory: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(directory, f'dual_credit_{database}_{taken.strftime(TIMESTAMP_FORMAT)}.parquet')
+
+
+def list_snapshots(database: str, directory: str = SNAPSHOT_DIR) -> list[tuple[datetime, str]]:
+    """Return (taken, path) for every snapshot of a database, newest first."""
+    snapshots = []
+    for path in glob.glob(os.path.join(directory, f'dual_credit_{database}_*.parquet')):
+        stamp = os.path.basename(path)[len(f'dual_credit_{database}_'):-len('.parquet')]
+        try:
+            snapshots.append((datetime.strptime(stamp, TIMESTAMP_FORMAT), path))
+        except ValueError:
+            continue
+    return sorted(snapshots, reverse=True)
+
+
+def latest_snapshot(database: str, ttl_minutes: int = SNAPSHOT_TTL_MINUTES, directory: str = SNAPSHOT_DIR) -> str:
+    """Return the newest snapshot younger than `ttl_minutes`, or None."""
+    snapshots = list_snapshots(database, directory)
+    if snapshots and datetime.now() - snapshots[0][0] <= timedelta(minutes=ttl_minutes):
+        return snapshots[0][1]
+    return None
+
+
+def take_snapshot(cnxn: Engine, sql: str, database: str, chunk_size: int = SNAPSHOT_CHUNK_SIZE, directory: str = SNAPSHOT_DIR) -> str:
+    """
+    Stream the full dual credit query into a new Parquet snapshot and return its path.
+
+    Chunks are written as row groups as they arrive, so memory stays bounded by the chunk
+    size. The file is written under a temporary name and renamed when complete, and only
+    the newest SNAPSHOTS_KEPT snapshots of the database are kept.
+    """
+    require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    path = snapshot_path(database, datetime.now(), directory)
+    temp_path = f'{path}.tmp'
+    schema = snapshot_schema()
+    rows = 0
+    try:
+        with pq.ParquetWriter(temp_path, schema) as writer:
+            for chunk in stream_dual_credit_courses(cnxn, sql, chunk_size):
+                frame = chunk[DUAL_CREDIT_COLUMNS].astype({'CN': 'string', 'MK': 'string'})
+                writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+                rows += len(frame)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    log.info("Wrote dual credit snapshot %s (%d rows)", path, rows)
+    for _, old_path in list_snapshots(database, directory)[SNAPSHOTS_KEPT:]:
+        os.remove(old_path)
+    return path
+
+
+def get_snapshot(cnxn: Engine, sql: str, database: str, ttl_minutes: int = SNAPSHOT_TTL_MINUTES, refresh: bool = False, directory: str = SNAPSHOT_DIR) -> str:
+    """Return a snapshot no older than `ttl_minutes`, taking a new one if needed (or if `refresh`)."""
+    path = None if refresh else latest_snapshot(database, ttl_minutes, directory)
+    if path is None:
+        path = take_snapshot(cnxn, sql, database, directory=directory)
+    else:
+        log.info("Using dual credit snapshot %s", path)
+    return path
+
+
+def read_snapshot(path: str, columns: list[str] = None, courses: list[str] = None, pids: list[int] = None, years: list[int] = None, since_year: int = None) -> DataFrame:
+    """
+    Read part of a snapshot. Only the requested columns are read, and the filters are pushed
+    into the Parquet reader, which skips row groups whose statistics rule them out.
+
+    Returns:
+        DataFrame: Compact frame like read_dual_credit_courses
+    """
+    require_pyarrow()
+    filters = []
+    if courses:
+        filters.append(('CN', 'in', [str(cn) for cn in courses]))
+    if pids:
+        filters.append(('PID', 'in', [int(pid) for pid in pids]))
+    if years:
+        filters.append(('YR', 'in', [int(year) for year in years]))
+    if since_year is not None:
+        filters.append(('YR', '>=', int(since_year)))
+    table = pq.read_table(path, columns=columns, filters=filters or None)
+    return compact_dual_credit_frame(table.to_pandas())
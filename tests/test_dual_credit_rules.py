@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from pandas import DataFrame
+from dual_credit_query import compact_dual_credit_frame
+from dual_credit_rules import check_year_long_pass, evaluate_dual_credit_courses, sort_dual_credit_rows
+
+COURSES = ['8250', '8250CE', '8250SD', '3160', '4141', '75701', 'L8000', 'TMY1']
+COURSE_TERMS = {'3160': 'S', '4141': 'S', '8250': 'Y', 'TMY1': 'Y', '75701': ' '}
+MARKS = ['A', 'A-', 'B+', 'b', ' c', 'C-', 'D', 'F', 'P', 'p', 'NP', 'NGR', 'I', 'W', '']
+TERMS = [1, 2, 3, 4]
+
+
+def random_dual_credit_rows(n_rows: int, seed: int) -> DataFrame:
+    """Random (PID, YR, CN, TE, MK) rows shaped and typed like the dual credit query result."""
+    rng = np.random.default_rng(seed)
+    return compact_dual_credit_frame(DataFrame({
+        'PID': rng.integers(1, n_rows // 8 + 2, size=n_rows),
+        'YR': rng.choice([22, 23, 24], size=n_rows),
+        'CN': rng.choice(COURSES, size=n_rows),
+        'SQ': np.arange(1, n_rows + 1),
+        'TE': rng.choice(TERMS, size=n_rows, p=[0.4, 0.4, 0.1, 0.1]),
+        'MK': rng.choice(MARKS, size=n_rows),
+        'SDE': 0,
+        'ST': 0,
+        'CH': 0.0,
+    }))
+
+
+def reference_results(data: DataFrame) -> dict:
+    """Run check_year_long_pass student-year by student-year."""
+    results = {}
+    for (pid, year), courses in data.groupby(['PID', 'YR'], sort=False):
+        for cn, status in check_year_long_pass(courses, COURSE_TERMS).items():
+            results[(pid, year, str(cn))] = (status['passed'], status['is_year_long'])
+    return results
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_check_year_long_pass(seed):
+    data = sort_dual_credit_rows(random_dual_credit_rows(800, seed))
+    evaluated = evaluate_dual_credit_courses(data, COURSE_TERMS)
+    vectorized = {
+        (pid, year, str(cn)): (bool(group['PASSED'].iloc[0]), bool(group['IS_YEAR_LONG'].iloc[0]))
+        for (pid, year, cn), group in evaluated.groupby(['PID', 'YR', 'CN'], sort=False, observed=True)
+    }
+    assert vectorized == reference_results(data)
+
+
+def test_8250_only_needs_one_c_but_variants_need_semester_two():
+    data = compact_dual_credit_frame(DataFrame({
+        'PID': [1, 1, 1, 1],
+        'YR': [24, 24, 24, 24],
+        'CN': ['8250', '8250', '8250CE', '8250CE'],
+        'SQ': [1, 2, 3, 4],
+        'TE': [1, 2, 1, 2],
+        'MK': ['C', 'F', 'C', 'F'],
+    }))
+    evaluated = evaluate_dual_credit_courses(sort_dual_credit_rows(data), COURSE_TERMS)
+    passed = evaluated.groupby('CN', observed=True)['PASSED'].first()
+    assert passed['8250'] and not passed['8250CE']
+    assert reference_results(data) == {(1, 24, '8250'): (True, True), (1, 24, '8250CE'): (False, True)}
+
+
+def test_crs_year_long_single_term_course():
+    data = compact_dual_credit_frame(DataFrame({
+        'PID': [1], 'YR': [24], 'CN': ['TMY1'], 'SQ': [1], 'TE': [1], 'MK': ['A'],
+    }))
+    evaluated = evaluate_dual_credit_courses(data, COURSE_TERMS)
+    # Year-long by CRS, with no semester 2 record to pass
+    assert bool(evaluated['IS_YEAR_LONG'].iloc[0]) and not bool(evaluated['PASSED'].iloc[0])
+    assert reference_results(data) == {(1, 24, 'TMY1'): (False, True)}
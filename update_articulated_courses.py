@@ -1,60 +1,91 @@
-from pandas import DataFrame, read_sql_query
-from slusdlib import aeries, core, decorators
-from course_hour_mappings import COURSE_HOURS_MAPPING, get_course_hours
-from sqlalchemy import bindparam, text
-from decouple import config
+from pandas import isna
+from slusdlib import decorators
+from course_hour_mappings import COURSE_HOURS_MAPPING, get_course_classification
+from course_catalog import load_course_classifications, set_course_classification
+from sqlalchemy import text
+from db import get_cnxn, get_sql
+from logs import get_logger
+from metrics import add_rows, timed, track_run
 
-SQL = core.build_sql_object()
-CNXN = aeries.get_aeries_cnxn(database=config('DATABASE', cast=str), access_level='w') if config('TEST', cast=bool) == False else aeries.get_aeries_cnxn(database=config('TEST_DATABASE', cast=str), access_level='w')
+log = get_logger('update_articulated_courses')
 
+
+def plan_classification_changes(classifications: dict, courses: list[str]) -> list[dict]:
+    """
+    Compare the current CRS CL of each course with the CL it should have.
+
+    Args:
+        classifications: CL of every CRS row per course, from load_course_classifications
+        courses: Mapped course numbers to check; courses missing from CRS are ignored
+
+    Returns:
+        list: {'cn', 'cl', 'current_cl'} for every course with a CRS row whose CL differs
+              (current_cl is the first differing value), in course order
+    """
+    changes = []
+    for cn in courses:
+        if cn not in classifications:
+            continue
+        cl = get_course_classification(cn)
+        current_cl = next((value for value in classifications[cn] if isna(value) or int(value) != cl), cl)
+        if isna(current_cl) or int(current_cl) != cl:
+            changes.append({'cn': cn, 'cl': cl, 'current_cl': None if isna(current_cl) else int(current_cl)})
+    return changes
+
+
+@track_run('update-articulated')
 @decorators.log_function_timer
-def update_articulated_courses() -> None:
+def update_articulated_courses(courses: list[str] = None) -> dict:
     """
-    Update CRS records for articulated courses based on course mappings.
+    Set CRS CL on mapped courses: 24 for articulated courses, 23 for college credit only ones.
+
+    Current CL values are read from CRS at the start of this step (one query, not the shared
+    snapshot, which may have been loaded long before), and only the courses whose CL differs
+    are written, in a single transaction. A run where every course is already correct sends
+    no writes.
+
+    Args:
+        courses: Only update these course numbers (defaults to every mapped course)
+
+    Returns:
+        dict: {'changed': [{'cn', 'cl', 'current_cl'}, ...], 'unchanged': int, 'missing': [cn, ...]}
     """
-    articulated_courses: list[str] = list(COURSE_HOURS_MAPPING.keys())
-    
-    # Update college credit only courses
-    college_credit_only_courses: list[str] = [
-        '4141',
-        '4142'
-    ]
-    
-    with CNXN.connect() as conn:
-
-        try:
-            sql_statement = text(SQL.update_articulated_courses_bulk).bindparams(
-                bindparam("cn_list", expanding=True)
-            )
-            result = conn.execute(
-                sql_statement,
-                {
-                    "cl": 24,
-                    "cn_list": articulated_courses
-                }
-            )
-            conn.commit()
-            core.log(f"Updated {result.rowcount} articulated courses to CL = 24.")
-        except Exception as e:
-            core.log(f"Error updating articulated courses: {e}")
-            raise
-
-        
-        try:
-            sql_statement = text(SQL.update_articulated_courses_bulk).bindparams(
-                bindparam("cn_list", expanding=True)
-            )
-            result = conn.execute(
-                sql_statement,
-                {
-                    "cl": 23,
-                    "cn_list": college_credit_only_courses
-                }
-            )
-            conn.commit()
-            core.log(f"Updated {result.rowcount} college credit only courses to CL = 23.")
-        except Exception as e:
-            core.log(f"Error updating college credit only courses: {e}")
-            raise
+    scope = {str(cn) for cn in courses} if courses else None
+    in_scope = [cn for cn in COURSE_HOURS_MAPPING.keys() if scope is None or cn in scope]
+    with timed('read'):
+        classifications = load_course_classifications(get_cnxn(), get_sql().course_classifications, in_scope)
+    with timed('evaluate'):
+        changes = plan_classification_changes(classifications, in_scope)
+    found = [cn for cn in in_scope if cn in classifications]
+    report = {
+        'changed': changes,
+        'unchanged': len(found) - len(changes),
+        'missing': [cn for cn in in_scope if cn not in classifications],
+    }
+    add_rows('read', len(found))
+    add_rows('skipped', report['unchanged'])
+
+    if changes:
+        with timed('write'):
+            try:
+                with get_cnxn().begin() as conn:
+                    result = conn.execute(
+                        text(get_sql().update_articulated_course),
+                        [{'cl': change['cl'], 'cn': change['cn']} for change in changes],
+                    )
+            except Exception as e:
+                log.error("Error updating course classifications, transaction rolled back: %s", e)
+                raise
+        # Keep the shared snapshot in step with CRS for the rest of the run
+        for change in changes:
+            set_course_classification(change['cn'], change['cl'])
+        add_rows('updated', result.rowcount if result.rowcount is not None and result.rowcount >= 0 else len(changes))
+
+    log.info("Course classifications: %d changed, %d already correct", len(changes), report['unchanged'])
+    for change in changes:
+        log.info("  %s: CL %s -> %s", change['cn'], change['current_cl'], change['cl'])
+    return report
+
+
 if __name__ == "__main__":
-    update_articulated_courses()
\ No newline at end of file
+    update_articulated_courses()